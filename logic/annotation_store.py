@@ -0,0 +1,285 @@
+"""
+选点标注存储
+
+选点按列保存在可增长的 NumPy 数组中（坐标、类型、颜色、所属点对）；每个点对的派生特征
+在成对时计算一次，保存在特征矩阵的一行中。删除只做标记，不移动数据。
+均匀网格空间索引用于悬停/点击命中测试；套索选择先按包围盒筛选坐标列，再查栅格化的多边形掩膜。
+"""
+import cv2
+import numpy as np
+import pandas as pd
+
+SAMPLE, SUBSTRATE = 0, 1
+
+# 与采集 CSV 一致的特征列（CSV 中差值保留符号，训练与预测时取绝对值）
+FEATURE_COLUMNS = [
+    "R1", "G1", "B1", "H1", "S1", "V1",
+    "R2", "G2", "B2", "H2", "S2", "V2",
+    "ratio_R", "ratio_G", "ratio_B", "ratio_H", "ratio_S", "ratio_V",
+    "diff_R", "diff_G", "diff_B", "diff_H", "diff_S", "diff_V",
+]
+CSV_COLUMNS = FEATURE_COLUMNS + ["layer_count"]
+
+
+def pair_features(rgb1, hsv1, rgb2, hsv2, signed: bool = True, dtype=np.float64):
+    """
+    按行构造 24 个特征（列顺序同 FEATURE_COLUMNS），rgb 为 (n, 3)，hsv 为归一化后的 (n, 3)，
+    返回 dtype 的 (n, 24) 数组。采集 CSV 中差值保留符号；signed=False 时取绝对值，
+    即训练（trainer.load_data）与预测（GraphenePredictor）使用的特征。
+    """
+    rgb1 = np.asarray(rgb1).reshape(-1, 3)
+    out = np.empty((len(rgb1), len(FEATURE_COLUMNS)), dtype=dtype, order="F")
+    # 各组特征直接写入结果的列块，不做中间拼接；按列存储，转为 DataFrame 时不必转置
+    a, b, ratio, diff = out[:, 0:6], out[:, 6:12], out[:, 12:18], out[:, 18:24]
+    a[:, :3], a[:, 3:] = rgb1, np.asarray(hsv1).reshape(-1, 3)
+    b[:, :3], b[:, 3:] = np.asarray(rgb2).reshape(-1, 3), np.asarray(hsv2).reshape(-1, 3)
+    ratio[...] = 0
+    np.divide(a, b, out=ratio, where=b != 0)
+    np.subtract(a, b, out=diff)
+    if not signed:
+        np.abs(diff, out=diff)
+    return out
+
+
+def features_to_frame(features, layer_count):
+    """特征矩阵 → 采集 CSV 格式的 DataFrame（RGB 列为整数）"""
+    df = pd.DataFrame(features, columns=FEATURE_COLUMNS)
+    for c in ["R1", "G1", "B1", "R2", "G2", "B2", "diff_R", "diff_G", "diff_B"]:
+        df[c] = df[c].astype(int)
+    df["layer_count"] = np.asarray(layer_count).astype(int)
+    return df
+
+
+def _grow(arr: np.ndarray, n: int):
+    if n <= len(arr):
+        return arr
+    out = np.empty((max(n, 2 * len(arr), 64),) + arr.shape[1:], dtype=arr.dtype)
+    out[:len(arr)] = arr
+    return out
+
+
+def _points_in_polygon(x: np.ndarray, y: np.ndarray, poly: np.ndarray, max_side: int = 1024):
+    """
+    把多边形栅格化为包围盒内的掩膜再按点查表（点须已在包围盒内）；
+    包围盒较大时按比例缩小栅格，边界误差约为 1 / scale 个像素。
+    """
+    x0, y0 = poly.min(axis=0)
+    extent = poly.max(axis=0) - (x0, y0)
+    scale = min(1.0, max_side / max(extent.max(), 1.0))
+    w, h = (extent * scale).astype(int) + 1
+    mask = np.zeros((h, w), dtype=np.uint8)
+    cv2.fillPoly(mask, [((poly - (x0, y0)) * scale).astype(np.int32)], 1)
+    cols = ((x - np.float32(x0)) * np.float32(scale)).astype(np.int32)
+    rows = ((y - np.float32(y0)) * np.float32(scale)).astype(np.int32)
+    # float32 的舍入可能让落在最大边上的点算到第 w 列或第 h 行
+    np.clip(cols, 0, w - 1, out=cols)
+    np.clip(rows, 0, h - 1, out=rows)
+    return mask.ravel().take(rows * w + cols).view(bool)
+
+
+class AnnotationStore:
+    """选点与点对的列式存储：奇数次添加为样本点，其后一个点为衬底点并组成点对"""
+
+    def __init__(self, cell_size: int = 32):
+        self.cell_size = cell_size
+        self.clear()
+
+    def clear(self):
+        # 点
+        self._n = 0
+        self._n_alive = 0
+        self._xy = np.empty((0, 2), dtype=np.float32)
+        self._kind = np.empty(0, dtype=np.uint8)
+        self._rgb = np.empty((0, 3), dtype=np.uint8)
+        self._hsv = np.empty((0, 3), dtype=np.float64)
+        self._point_pair = np.empty(0, dtype=np.int64)
+        self._point_alive = np.empty(0, dtype=bool)
+        self._pending = -1  # 等待衬底点的样本点
+        # 点对
+        self._n_pairs = 0
+        self._n_alive_pairs = 0
+        self._pair_points = np.empty((0, 2), dtype=np.int64)
+        self._pair_layer = np.empty(0, dtype=np.int16)
+        self._pair_alive = np.empty(0, dtype=bool)
+        self._features = np.empty((0, len(FEATURE_COLUMNS)), dtype=np.float64)
+        # 网格索引：(cx, cy) → 点下标列表
+        self._grid = {}
+
+    def __len__(self):
+        return self._n_alive
+
+    def pair_count(self):
+        return self._n_alive_pairs
+
+    def has_pending(self):
+        return self._pending >= 0
+
+    def _cell(self, x, y):
+        return int(x // self.cell_size), int(y // self.cell_size)
+
+    # ---------- 添加 ----------
+    def add_point(self, x: float, y: float, rgb, hsv, layer_count: int = -1) -> int:
+        i = self._n
+        n = i + 1
+        self._xy, self._kind = _grow(self._xy, n), _grow(self._kind, n)
+        self._rgb, self._hsv = _grow(self._rgb, n), _grow(self._hsv, n)
+        self._point_pair, self._point_alive = _grow(self._point_pair, n), _grow(self._point_alive, n)
+
+        kind = SUBSTRATE if self._pending >= 0 else SAMPLE
+        self._xy[i] = (x, y)
+        self._kind[i] = kind
+        self._rgb[i] = rgb
+        self._hsv[i] = hsv
+        self._point_pair[i] = -1
+        self._point_alive[i] = True
+        self._n = n
+        self._n_alive += 1
+        # 网格按保存后的 float32 坐标计算，与删除时一致
+        self._grid.setdefault(self._cell(*self._xy[i]), []).append(i)
+
+        if kind == SUBSTRATE:
+            self._make_pair(self._pending, i, layer_count)
+            self._pending = -1
+        else:
+            self._pending = i
+        return i
+
+    def _make_pair(self, sample: int, substrate: int, layer_count: int):
+        p = self._n_pairs
+        n = p + 1
+        self._pair_points, self._pair_layer = _grow(self._pair_points, n), _grow(self._pair_layer, n)
+        self._pair_alive, self._features = _grow(self._pair_alive, n), _grow(self._features, n)
+        self._pair_points[p] = (sample, substrate)
+        self._pair_layer[p] = -1 if layer_count is None else layer_count
+        self._pair_alive[p] = True
+        self._features[p] = pair_features(self._rgb[sample], self._hsv[sample],
+                                          self._rgb[substrate], self._hsv[substrate])[0]
+        self._point_pair[[sample, substrate]] = p
+        self._n_pairs = n
+        self._n_alive_pairs += 1
+
+    # ---------- 删除 ----------
+    def _kill_point(self, i: int):
+        if not self._point_alive[i]:
+            return
+        self._grid[self._cell(*self._xy[i])].remove(i)
+        self._point_alive[i] = False
+        self._n_alive -= 1
+        if self._pending == i:
+            self._pending = -1
+
+    def _kill_pair(self, p: int):
+        if not self._pair_alive[p]:
+            return
+        self._pair_alive[p] = False
+        self._point_pair[self._pair_points[p]] = -1
+        self._n_alive_pairs -= 1
+
+    def remove_last_point(self) -> int:
+        """撤销最后一个点；若它是衬底点，对应的样本点重新等待衬底。返回被删除的点，没有时为 -1"""
+        alive = np.flatnonzero(self._point_alive[:self._n])
+        if len(alive) == 0:
+            return -1
+        i = int(alive[-1])
+        p = self._point_pair[i]
+        if p >= 0:
+            self._kill_pair(p)
+            self._pending = int(self._pair_points[p, 0])
+        self._kill_point(i)
+        return i
+
+    def delete_pair(self, p: int):
+        """删除点对及其两个点；已删除（或已撤销）的点对不做任何操作"""
+        if not self._pair_alive[p]:
+            return
+        self._kill_pair(p)
+        for i in self._pair_points[p]:
+            self._kill_point(int(i))
+
+    def delete_point(self, i: int):
+        """删除任意一个点；已成对的点连同整个点对一起删除"""
+        p = self._point_pair[i]
+        if p >= 0:
+            self.delete_pair(int(p))
+        else:
+            self._kill_point(i)
+
+    def delete_points(self, indices):
+        for i in np.asarray(indices, dtype=np.int64):
+            self.delete_point(int(i))
+
+    # ---------- 查询 ----------
+    def hit_test(self, x: float, y: float, radius: float = 8.0) -> int:
+        """返回 radius 内最近的点，没有时为 -1"""
+        cx, cy = self._cell(x, y)
+        r = int(np.ceil(radius / self.cell_size))
+        cand = [i for dx in range(-r, r + 1) for dy in range(-r, r + 1)
+                for i in self._grid.get((cx + dx, cy + dy), ())]
+        if not cand:
+            return -1
+        cand = np.array(cand)
+        d2 = ((self._xy[cand] - np.float32((x, y))) ** 2).sum(axis=1)
+        k = np.argmin(d2)
+        return int(cand[k]) if d2[k] <= radius * radius else -1
+
+    def select_lasso(self, polygon) -> np.ndarray:
+        """返回多边形内的所有点"""
+        poly = np.asarray(polygon, dtype=np.float64).reshape(-1, 2)
+        if len(poly) < 3:
+            return np.empty(0, dtype=np.int64)
+        x, y = self._xy[:self._n, 0], self._xy[:self._n, 1]
+        (x0, y0), (x1, y1) = poly.min(axis=0), poly.max(axis=0)
+        idx = np.flatnonzero(self._point_alive[:self._n] & (x >= x0) & (x <= x1) & (y >= y0) & (y <= y1))
+        # 一维 take 比二维花式索引快得多
+        return idx[_points_in_polygon(x.take(idx), y.take(idx), poly)]
+
+    def points(self) -> np.ndarray:
+        return np.flatnonzero(self._point_alive[:self._n])
+
+    def pairs(self) -> np.ndarray:
+        return np.flatnonzero(self._pair_alive[:self._n_pairs])
+
+    def pairs_of(self, indices) -> np.ndarray:
+        p = np.unique(self._point_pair[np.asarray(indices, dtype=np.int64)])
+        return p[p >= 0]
+
+    def pair_of(self, i: int) -> int:
+        return int(self._point_pair[i])
+
+    def pair_ids(self, indices) -> np.ndarray:
+        """每个点所属的点对，未成对为 -1"""
+        return self._point_pair[np.asarray(indices, dtype=np.int64)]
+
+    def kind(self, i: int) -> int:
+        return int(self._kind[i])
+
+    def pair_points(self, p: int):
+        return tuple(int(i) for i in self._pair_points[p])
+
+    def layer_count(self, p: int) -> int:
+        return int(self._pair_layer[p])
+
+    def coordinates(self, indices=None):
+        return self._xy[self.points() if indices is None else indices]
+
+    def kinds(self, indices=None):
+        return self._kind[self.points() if indices is None else indices]
+
+    # ---------- 批量修改 ----------
+    def set_layer_count(self, pairs, layer_count: int):
+        self._pair_layer[np.asarray(pairs, dtype=np.int64)] = layer_count
+
+    # ---------- 导出 ----------
+    def pair_colors(self, pairs=None):
+        """返回 (rgb1, hsv1, rgb2, hsv2)，每项为 (n, 3) 数组"""
+        p = self.pairs() if pairs is None else np.asarray(pairs, dtype=np.int64)
+        s, t = self._pair_points[p, 0], self._pair_points[p, 1]
+        return self._rgb[s], self._hsv[s], self._rgb[t], self._hsv[t]
+
+    def feature_matrix(self):
+        p = self.pairs()
+        return self._features[p], self._pair_layer[p]
+
+    def to_frame(self) -> pd.DataFrame:
+        features, layers = self.feature_matrix()
+        return features_to_frame(features, layers)
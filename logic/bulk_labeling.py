@@ -0,0 +1,117 @@
+"""
+颜色聚类辅助的批量标注
+
+在缩小后的图像上做一次 MiniBatchKMeans 颜色聚类（Lab 空间），中心相近的聚类合并
+（同一种颜色因噪声被拆开时），标签按最近邻放大回原图，像素最多的聚类视为衬底。
+点击某个聚类（或其中的连通区域）并指定层数后，其中的像素经腐蚀去掉边缘、按颜色去重，
+只保留自身颜色也归入该聚类的像素，下采样后与衬底颜色配对，整体向量化地生成训练行。
+"""
+import cv2
+import numpy as np
+from scipy.cluster.hierarchy import fcluster, linkage
+from sklearn.cluster import MiniBatchKMeans
+
+from logic.annotation_store import pair_features, features_to_frame
+from logic.utils import rgb_to_hsv
+
+
+class ColorClusterLabeler:
+    def __init__(self, n_clusters: int = 8, max_side: int = 512, max_rows: int = 5000,
+                 erode: int = 2, merge_distance: float = 8.0, random_state: int = 0):
+        self.n_clusters = n_clusters
+        self.merge_distance = merge_distance  # OpenCV 8 位 Lab 空间中的距离
+        self.max_side = max_side      # 聚类前缩小到的最长边
+        self.max_rows = max_rows      # 每次点击最多生成的行数
+        self.erode = erode            # 腐蚀迭代次数，去掉区域边缘的混合像素
+        self.random_state = random_state
+        self.img = None
+        self.labels = None            # (h, w) uint8 聚类标签
+        self.n_found = 0              # 合并后的聚类数
+        self._centers = None          # k-means 中心（Lab）
+        self._merged = None           # k-means 聚类 → 合并后的聚类
+        self._border = 0              # 标签放大带来的边缘误差（像素）
+        self.substrate_cluster = None
+        self.substrate_rgb = None
+
+    def fit(self, img: np.ndarray):
+        """img 为 RGB uint8 图像，返回原图大小的聚类标签"""
+        self.img = img
+        h, w, _ = img.shape
+        scale = min(1.0, self.max_side / max(h, w))
+        small = cv2.resize(img, (max(1, round(w * scale)), max(1, round(h * scale))),
+                           interpolation=cv2.INTER_AREA)
+        lab = cv2.cvtColor(small, cv2.COLOR_RGB2LAB).reshape(-1, 3).astype(np.float32)
+        kmeans = MiniBatchKMeans(n_clusters=self.n_clusters, batch_size=4096, n_init=3,
+                                 random_state=self.random_state)
+        small_labels = kmeans.fit_predict(lab)
+        # 单链接合并中心距离小于 merge_distance 的聚类，重新编号为 0..k-1
+        merged = fcluster(linkage(kmeans.cluster_centers_, method='single'),
+                          self.merge_distance, criterion='distance') - 1
+        small_labels = merged.astype(np.uint8)[small_labels].reshape(small.shape[:2])
+        self.labels = cv2.resize(small_labels, (w, h), interpolation=cv2.INTER_NEAREST)
+        self.n_found = int(merged.max()) + 1
+        self._centers = kmeans.cluster_centers_
+        self._merged = merged
+        self._border = int(np.ceil(0.5 / scale))
+
+        counts = np.bincount(self.labels.ravel(), minlength=self.n_found)
+        self._set_substrate_cluster(int(np.argmax(counts)))
+        return self.labels
+
+    def cluster_at(self, x: int, y: int) -> int:
+        return int(self.labels[y, x])
+
+    def set_substrate(self, x: int, y: int):
+        """把 (x, y) 所在的聚类设为衬底"""
+        self._set_substrate_cluster(self.cluster_at(x, y))
+
+    def _set_substrate_cluster(self, cluster: int):
+        self.substrate_cluster = cluster
+        pixels = self.img[self._erode(self.labels == cluster)]
+        self.substrate_rgb = np.median(pixels, axis=0).round().astype(np.uint8)
+
+    def _erode(self, mask: np.ndarray):
+        iterations = self.erode + self._border
+        if iterations <= 0:
+            return mask
+        eroded = cv2.erode(mask.astype(np.uint8), np.ones((3, 3), np.uint8), iterations=iterations)
+        # 区域太小被腐蚀光时保留原区域
+        return eroded.view(bool) if eroded.any() else mask
+
+    def member_mask(self, x: int, y: int, connected: bool = False):
+        """(x, y) 所在聚类的像素；connected 为 True 时只取包含该点的连通区域"""
+        mask = self.labels == self.labels[y, x]
+        if connected:
+            _, components = cv2.connectedComponents(mask.astype(np.uint8), connectivity=4)
+            mask = components == components[y, x]
+        return self._erode(mask)
+
+    def classify(self, pixels: np.ndarray):
+        """(n, 3) RGB 像素按自身颜色归入的（合并后）聚类"""
+        lab = cv2.cvtColor(pixels.reshape(-1, 1, 3), cv2.COLOR_RGB2LAB).reshape(-1, 3).astype(np.float32)
+        d2 = ((lab[:, None, :] - self._centers[None, :, :].astype(np.float32)) ** 2).sum(axis=2)
+        return self._merged[np.argmin(d2, axis=1)]
+
+    def sample_pixels(self, mask: np.ndarray, cluster: int = None):
+        """区域内按颜色去重后的像素，超过 max_rows 时随机下采样"""
+        pixels = self.img[mask]
+        packed = pixels.astype(np.uint32) @ np.array([1 << 16, 1 << 8, 1], dtype=np.uint32)
+        _, first = np.unique(packed, return_index=True)
+        pixels = pixels[first]
+        if cluster is not None:
+            pixels = pixels[self.classify(pixels) == cluster]
+        if len(pixels) > self.max_rows:
+            rng = np.random.default_rng(self.random_state)
+            pixels = pixels[np.sort(rng.choice(len(pixels), self.max_rows, replace=False))]
+        return pixels
+
+    def training_rows(self, x: int, y: int, layer_count: int, connected: bool = False):
+        """生成采集 CSV 格式的训练行（DataFrame）"""
+        if self.labels is None:
+            raise RuntimeError("请先对图像聚类")
+        if self.cluster_at(x, y) == self.substrate_cluster:
+            raise ValueError("所选区域为衬底")
+        pixels = self.sample_pixels(self.member_mask(x, y, connected), self.cluster_at(x, y))
+        substrate = np.broadcast_to(self.substrate_rgb, pixels.shape)
+        features = pair_features(pixels, rgb_to_hsv(pixels), substrate, rgb_to_hsv(substrate))
+        return features_to_frame(features, np.full(len(pixels), layer_count))
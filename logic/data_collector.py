@@ -1,18 +1,19 @@
 import cv2
 import numpy as np
-import csv
+import pandas as pd
+from logic.annotation_store import AnnotationStore
 
 class GrapheneDataCollectorCore:
     def __init__(self):
         self.cv_img = None
         self.layer_count = None
-        self.points = []   
-        self.data = []     
+        self.store = AnnotationStore()  # 选点与点对特征
+        self.bulk_frames = []  # 聚类批量标注生成的训练行，每次点击一个 DataFrame
 
     def load_image(self, path: str, layer_count: int) -> bool:
         """加载图像并设置层数，成功返回True"""
-        self.points.clear()
-        self.data.clear()
+        self.store.clear()
+        self.bulk_frames.clear()
         self.layer_count = layer_count
 
         try:
@@ -31,11 +32,10 @@ class GrapheneDataCollectorCore:
         return self.cv_img
 
     def get_points(self):
-        return self.points
+        return self.store
 
     def undo_last_point(self):
-        if self.points:
-            self.points.pop()
+        self.store.remove_last_point()
 
     def add_point(self, x: int, y: int):
         if self.cv_img is None:
@@ -47,61 +47,42 @@ class GrapheneDataCollectorCore:
 
         rgb = self.cv_img[y, x]
         hsv = cv2.cvtColor(np.uint8([[rgb]]), cv2.COLOR_RGB2HSV)[0][0]
-        h, s, v = hsv.astype(float) / [179.0, 255.0, 255.0]  # 归一化
-
-        self.points.append(((rgb, (h, s, v)), (x, y)))
-
-        if len(self.points) % 2 == 0:
-            (rgb1, (h1, s1, v1)), _ = self.points[-2]
-            (rgb2, (h2, s2, v2)), _ = self.points[-1]
-
-            r1, g1, b1 = map(int, rgb1)
-            r2, g2, b2 = map(int, rgb2)
-
-
-            def safe_div(a, b):
-                return float(a) / b if b != 0 else 0.0
-
-            row = {
-                "R1": r1, "G1": g1, "B1": b1,
-                "H1": h1, "S1": s1, "V1": v1,
-                "R2": r2, "G2": g2, "B2": b2,
-                "H2": h2, "S2": s2, "V2": v2,
-                "ratio_R": safe_div(r1, r2),
-                "ratio_G": safe_div(g1, g2),
-                "ratio_B": safe_div(b1, b2),
-                "ratio_H": safe_div(h1, h2),
-                "ratio_S": safe_div(s1, s2),
-                "ratio_V": safe_div(v1, v2),
-                "diff_R": r1 - r2,
-                "diff_G": g1 - g2,
-                "diff_B": b1 - b2,
-                "diff_H": h1 - h2,
-                "diff_S": s1 - s2,
-                "diff_V": v1 - v2,
-                "layer_count": self.layer_count
-            }
-
-            self.data.append(row)
+        hsv = hsv.astype(float) / [179.0, 255.0, 255.0]  # 归一化
 
+        # 第二个点与前一个样本点组成点对，特征在存储中计算
+        self.store.add_point(x, y, rgb, hsv, self.layer_count)
         return True
 
+    def delete_at(self, x: float, y: float, radius: float = 8.0) -> bool:
+        """删除 (x, y) 附近的点（已成对的连同点对一起删除）"""
+        i = self.store.hit_test(x, y, radius)
+        if i < 0:
+            return False
+        self.store.delete_point(i)
+        return True
+
+    def set_layer_count(self, pairs, layer_count: int):
+        self.store.set_layer_count(pairs, layer_count)
+
+    def add_bulk_rows(self, rows: pd.DataFrame):
+        if len(rows):
+            self.bulk_frames.append(rows)
+
+    def undo_bulk_rows(self):
+        if self.bulk_frames:
+            self.bulk_frames.pop()
+
+    def row_count(self):
+        return self.store.pair_count() + sum(len(df) for df in self.bulk_frames)
+
+    def to_frame(self):
+        return pd.concat([self.store.to_frame()] + self.bulk_frames, ignore_index=True)
 
     def get_data(self):
-        return self.data
+        return self.to_frame().to_dict("records")
 
     def export_to_csv(self, path: str):
-        if not self.data:
+        if self.row_count() == 0:
             return False
-
-        with open(path, "w", newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow([
-                "R1", "G1", "B1", "H1", "S1", "V1",
-                "R2", "G2", "B2", "H2", "S2", "V2",
-                "ratio_R", "ratio_G", "ratio_B", "ratio_H", "ratio_S", "ratio_V",
-                "layer_count"
-            ])
-            writer.writerows(self.data)
-
+        self.to_frame().to_csv(path, index=False)
         return True
@@ -0,0 +1,310 @@
+"""
+分布式超参数搜索
+
+调度端（训练程序）监听一个地址，工作进程通过 multiprocessing.connection
+连接上来领取 (参数组合 × 折) 任务。工作进程可以在本机启动，也可以在其他主机上运行：
+
+    python -m logic.distributed_search --connect 192.168.1.10:6100 --authkey <密钥>
+
+连接上传输的是 pickle 数据，密钥是唯一的访问控制：未指定密钥时只允许监听本机回环地址，
+并使用随机生成的密钥。
+"""
+import argparse
+import ipaddress
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import secrets
+import threading
+import time
+import traceback
+from multiprocessing.connection import Listener, Client
+
+import numpy as np
+from scipy.stats import rankdata
+from sklearn.base import clone, is_classifier
+from sklearn.metrics import get_scorer
+from sklearn.model_selection import ParameterGrid, check_cv
+
+def parse_address(text: str):
+    host, _, port = text.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def listener_authkey(address, authkey: bytes = None) -> bytes:
+    """
+    监听端使用的密钥：指定了密钥直接使用；未指定时只允许监听本机回环地址并生成随机密钥，
+    监听其他地址时抛出 ValueError（否则网络上的任何人都能发送 pickle 数据）
+    """
+    if authkey:
+        return authkey
+    if not is_loopback(address[0]):
+        raise ValueError(f"监听非本机地址 {address[0]} 时必须指定密钥")
+    return secrets.token_hex(16).encode()
+
+
+def run_worker(address, authkey: bytes):
+    """工作进程主循环：接收数据与任务，返回该折的得分"""
+    conn = Client(tuple(address), authkey=authkey)
+    job_id, X, y, fit_params = None, None, None, {}
+    while True:
+        try:
+            msg = conn.recv()
+        except (EOFError, OSError):
+            break
+        kind = msg[0]
+        if kind == "stop":
+            break
+        if kind == "data":
+            _, job_id, X, y, fit_params = msg
+            continue
+        # ("fit", task_id, job_id, estimator, params, train_idx, test_idx, scoring)
+        _, task_id, task_job, estimator, params, train_idx, test_idx, scoring = msg
+        try:
+            if task_job != job_id:
+                raise RuntimeError(f"缺少任务 {task_job} 的数据")
+            start = time.perf_counter()
+            est = clone(estimator).set_params(**params)
+            est.fit(X[train_idx], y[train_idx], **_index_params(fit_params, train_idx))
+            fit_time = time.perf_counter() - start
+            score = get_scorer(scoring)(est, X[test_idx], y[test_idx])
+            conn.send(("result", task_id, float(score), fit_time))
+        except Exception:
+            conn.send(("error", task_id, traceback.format_exc()))
+    conn.close()
+
+
+def _index_params(fit_params: dict, idx):
+    # 与样本一一对应的参数（如 sample_weight）按折取子集
+    return {k: v[idx] if hasattr(v, "__len__") and not isinstance(v, str) else v
+            for k, v in fit_params.items()}
+
+
+class DistributedBackend:
+    """任务调度端：接受工作进程连接，分发任务，失败重试并汇总结果"""
+
+    def __init__(self, address=("127.0.0.1", 0), authkey: bytes = None,
+                 max_retries: int = 2, worker_timeout: float = 60.0, task_timeout: float = 600.0,
+                 progress_callback=None):
+        self.authkey = listener_authkey(address, authkey)  # 本机工作进程由 start_local_workers 传入
+        self.max_retries = max_retries
+        self.worker_timeout = worker_timeout  # 没有任何工作进程时最多等待的秒数
+        self.task_timeout = task_timeout      # 单个任务最多等待的秒数，None 为不限
+        self.progress_callback = progress_callback
+        self._listener = Listener(tuple(address), backlog=64, authkey=self.authkey)
+        self.address = self._listener.address
+        self._tasks = queue.Queue()
+        self._results = queue.Queue()
+        self._jobs = {}
+        self._job_ids = itertools.count()
+        self._workers = 0
+        self._lock = threading.Lock()
+        self._closed = False
+        self._local_procs = []
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+
+    def worker_count(self):
+        with self._lock:
+            return self._workers
+
+    def start_local_workers(self, n: int = None):
+        """在本机启动 n 个工作进程（默认 CPU 核数）"""
+        n = n or os.cpu_count() or 1
+        host, port = self.address
+        if host in ("0.0.0.0", ""):
+            host = "127.0.0.1"
+        ctx = mp.get_context("spawn")
+        for _ in range(n):
+            p = ctx.Process(target=run_worker, args=((host, port), self.authkey), daemon=True)
+            p.start()
+            self._local_procs.append(p)
+
+    def close(self):
+        self._closed = True
+        with self._lock:
+            n = self._workers
+        for _ in range(n):
+            self._tasks.put(None)
+        self._listener.close()
+        for p in self._local_procs:
+            p.join(timeout=5)
+            if p.is_alive():
+                p.terminate()
+        self._local_procs.clear()
+
+    def _accept_loop(self):
+        while not self._closed:
+            try:
+                conn = self._listener.accept()
+            except Exception:
+                if self._closed:
+                    break
+                continue
+            with self._lock:
+                self._workers += 1
+            threading.Thread(target=self._serve_worker, args=(conn,), daemon=True).start()
+
+    def _serve_worker(self, conn):
+        sent_job = None
+        try:
+            while True:
+                task = self._tasks.get()
+                if task is None:
+                    conn.send(("stop",))
+                    break
+                job_id, task_id, payload = task
+                try:
+                    if sent_job != job_id:
+                        X, y, fit_params = self._jobs[job_id]
+                        conn.send(("data", job_id, X, y, fit_params))
+                        sent_job = job_id
+                    conn.send(("fit", task_id, job_id) + payload)
+                    if not conn.poll(self.task_timeout):
+                        # 工作进程卡死或失联：放弃该连接，任务记为一次失败交回调度端重试
+                        self._results.put((job_id, task_id, False,
+                                           f"工作进程 {self.task_timeout:g} 秒内未返回结果"))
+                        break
+                    reply = conn.recv()
+                except (EOFError, OSError) as e:
+                    # 连接断开：任务记为一次失败，交回调度端重试
+                    self._results.put((job_id, task_id, False, f"工作进程断开：{e}"))
+                    break
+                if reply[0] == "result":
+                    self._results.put((job_id, task_id, True, reply[2]))
+                else:
+                    self._results.put((job_id, task_id, False, reply[2]))
+        finally:
+            conn.close()
+            with self._lock:
+                self._workers -= 1
+
+    def run(self, X, y, payloads: list, fit_params: dict = None) -> list:
+        """执行一批任务，返回与 payloads 顺序一致的得分"""
+        job_id = next(self._job_ids)
+        self._jobs[job_id] = (X, y, fit_params or {})
+        attempts = [0] * len(payloads)
+        scores = [None] * len(payloads)
+        for task_id, payload in enumerate(payloads):
+            self._tasks.put((job_id, task_id, payload))
+
+        done = 0
+        idle_since = None
+        try:
+            while done < len(payloads):
+                try:
+                    r_job, task_id, ok, value = self._results.get(timeout=1.0)
+                except queue.Empty:
+                    if self.worker_count() > 0:
+                        idle_since = None
+                    elif idle_since is None:
+                        idle_since = time.monotonic()
+                    elif time.monotonic() - idle_since > self.worker_timeout:
+                        raise RuntimeError("没有可用的工作进程")
+                    continue
+                if r_job != job_id:
+                    continue
+                if ok:
+                    scores[task_id] = value
+                    done += 1
+                    if self.progress_callback:
+                        self.progress_callback(done, len(payloads))
+                    continue
+                attempts[task_id] += 1
+                if attempts[task_id] > self.max_retries:
+                    raise RuntimeError(f"任务 {task_id} 重试 {self.max_retries} 次后仍失败：\n{value}")
+                self._tasks.put((job_id, task_id, payloads[task_id]))
+        finally:
+            del self._jobs[job_id]
+            self._drain(job_id)
+        return scores
+
+    def _drain(self, job_id):
+        # 丢弃本批未执行的任务（出错提前结束时）
+        pending = []
+        while True:
+            try:
+                task = self._tasks.get_nowait()
+            except queue.Empty:
+                break
+            if task is None or task[0] != job_id:
+                pending.append(task)
+        for task in pending:
+            self._tasks.put(task)
+
+
+class DistributedSearchCV:
+    """与 GridSearchCV 结果一致的网格搜索，折拟合由 DistributedBackend 分发"""
+
+    def __init__(self, estimator, param_grid, backend: DistributedBackend,
+                 cv=5, scoring='accuracy', refit=True):
+        self.estimator = estimator
+        self.param_grid = param_grid
+        self.backend = backend
+        self.cv = cv
+        self.scoring = scoring
+        self.refit = refit
+
+    def fit(self, X, y, **fit_params):
+        X, y = np.asarray(X), np.asarray(y)
+        fit_params = {k: np.asarray(v) if hasattr(v, "__len__") and not isinstance(v, str) else v
+                      for k, v in fit_params.items()}
+        cv = check_cv(self.cv, y, classifier=is_classifier(self.estimator))
+        candidates = list(ParameterGrid(self.param_grid))
+        splits = list(cv.split(X, y))
+
+        payloads = [
+            (self.estimator, params, train, test, self.scoring)
+            for params in candidates
+            for train, test in splits
+        ]
+        scores = self.backend.run(X, y, payloads, fit_params)
+        scores = np.array(scores).reshape(len(candidates), len(splits))
+
+        mean = scores.mean(axis=1)
+        rank = rankdata(-mean, method="min").astype(np.int32)
+        self.cv_results_ = {
+            "params": candidates,
+            "mean_test_score": mean,
+            "std_test_score": scores.std(axis=1),
+            "rank_test_score": rank,
+        }
+        for i in range(len(splits)):
+            self.cv_results_[f"split{i}_test_score"] = scores[:, i]
+
+        self.best_index_ = int(rank.argmin())
+        self.best_params_ = candidates[self.best_index_]
+        self.best_score_ = mean[self.best_index_]
+        if self.refit:
+            self.best_estimator_ = clone(self.estimator).set_params(**self.best_params_)
+            self.best_estimator_.fit(X, y, **fit_params)
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分布式超参数搜索工作进程")
+    parser.add_argument("--connect", required=True, help="调度端地址，例如 192.168.1.10:6100")
+    parser.add_argument("--authkey", required=True, help="与调度端相同的密钥")
+    parser.add_argument("--workers", type=int, default=1, help="本机启动的工作进程数")
+    args = parser.parse_args()
+
+    address = parse_address(args.connect)
+    authkey = args.authkey.encode()
+    procs = [mp.Process(target=run_worker, args=(address, authkey)) for _ in range(args.workers)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+
+
+if __name__ == "__main__":
+    main()
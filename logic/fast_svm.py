@@ -0,0 +1,161 @@
+"""
+大批量 SVM 推理
+
+从训练好的 sklearn SVC(probability=True) 中取出支持向量、对偶系数、截距、gamma
+和 Platt 参数 A/B，用分块的 float32 矩阵乘法（BLAS）计算一对一决策值，
+再按 libsvm 的方法做两两概率耦合，结果与 SVC.predict_proba 在误差范围内一致。
+
+float64 下与 sklearn 的差异在 1e-13 以内；float32 下决策值的微小误差可能让耦合迭代
+（停止阈值 0.005 / 类别数）多走或少走一步，概率差异最大约为该阈值。
+"""
+import numpy as np
+from sklearn.pipeline import Pipeline
+from sklearn.svm import SVC
+
+# libsvm 中 Platt 概率的截断值
+MIN_PROB = 1e-7
+
+
+def unwrap_estimator(est):
+    """只有一个步骤的 Pipeline 直接取出其中的模型"""
+    if isinstance(est, Pipeline) and len(est.steps) == 1:
+        return est.steps[0][1]
+    return est
+
+
+class BatchSVMEvaluator:
+    def __init__(self, support_vectors, dual_coef, intercept, n_support, prob_a, prob_b,
+                 kernel='rbf', gamma=1.0, coef0=0.0, degree=3,
+                 dtype=np.float32, chunk_size: int = 16384):
+        self.dtype = dtype
+        self.chunk_size = chunk_size
+        self.kernel = kernel
+        self.gamma = float(gamma)
+        self.coef0 = float(coef0)
+        self.degree = int(degree)
+        self.support_vectors = np.ascontiguousarray(support_vectors, dtype=dtype)
+        self.sv_sq_norms = np.einsum('ij,ij->i', self.support_vectors, self.support_vectors)
+        self.intercept = np.asarray(intercept, dtype=np.float64)
+        self.prob_a = np.asarray(prob_a, dtype=np.float64)
+        self.prob_b = np.asarray(prob_b, dtype=np.float64)
+        self.n_classes = len(n_support)
+
+        # 把 libsvm 的一对一求和写成一个 (n_SV, n_pairs) 系数矩阵，决策值 = K @ W + intercept
+        dual_coef = np.asarray(dual_coef, dtype=np.float64)
+        start = np.concatenate([[0], np.cumsum(n_support)])
+        self.pairs = []
+        weights = np.zeros((len(self.support_vectors), len(self.intercept)), dtype=np.float64)
+        p = 0
+        for i in range(self.n_classes):
+            for j in range(i + 1, self.n_classes):
+                si, sj = slice(start[i], start[i + 1]), slice(start[j], start[j + 1])
+                weights[si, p] = dual_coef[j - 1, si]
+                weights[sj, p] = dual_coef[i, sj]
+                self.pairs.append((i, j))
+                p += 1
+        self.pair_weights = weights.astype(dtype)
+
+    @classmethod
+    def from_svc(cls, svc, **kwargs):
+        svc = unwrap_estimator(svc)
+        if not isinstance(svc, SVC):
+            raise TypeError(f"不支持的模型类型：{type(svc).__name__}")
+        if len(getattr(svc, 'probA_', [])) == 0:
+            raise ValueError("SVC 未启用 probability=True")
+        if callable(svc.kernel) or svc.kernel == 'precomputed':
+            raise ValueError(f"不支持的核函数：{svc.kernel}")
+        dual_coef, intercept = svc.dual_coef_, svc.intercept_
+        if len(svc.classes_) == 2:
+            # 二分类时公开属性相对 libsvm 翻转了符号，这里翻转回来
+            dual_coef, intercept = -dual_coef, -intercept
+        # gamma='scale' / 'auto' 时实际取值依赖训练数据，sklearn 只在 _gamma 中保存
+        gamma = svc.gamma if not isinstance(svc.gamma, str) else svc._gamma
+        return cls(
+            svc.support_vectors_, dual_coef, intercept, svc.n_support_,
+            svc.probA_, svc.probB_,
+            kernel=svc.kernel, gamma=gamma, coef0=svc.coef0, degree=svc.degree,
+            **kwargs,
+        )
+
+    def _kernel(self, X):
+        dot = X @ self.support_vectors.T
+        if self.kernel == 'linear':
+            return dot
+        if self.kernel == 'rbf':
+            sq = np.einsum('ij,ij->i', X, X)[:, None] + self.sv_sq_norms[None, :] - 2 * dot
+            np.maximum(sq, 0, out=sq)
+            sq *= -self.gamma
+            return np.exp(sq, out=sq)
+        if self.kernel == 'poly':
+            return (self.gamma * dot + self.coef0) ** self.degree
+        if self.kernel == 'sigmoid':
+            return np.tanh(self.gamma * dot + self.coef0)
+        raise ValueError(f"不支持的核函数：{self.kernel}")
+
+    def decision_function(self, X):
+        """一对一决策值，形状 (n_samples, n_pairs)，顺序与 libsvm 相同"""
+        X = np.asarray(X, dtype=self.dtype)
+        out = np.empty((len(X), len(self.intercept)), dtype=np.float64)
+        for s in range(0, len(X), self.chunk_size):
+            chunk = X[s:s + self.chunk_size]
+            out[s:s + len(chunk)] = self._kernel(chunk) @ self.pair_weights
+        out += self.intercept
+        return out
+
+    def _pairwise_prob(self, dec):
+        # libsvm sigmoid_predict 的数值稳定写法
+        f = dec * self.prob_a + self.prob_b
+        pos = f >= 0
+        p = np.empty_like(f)
+        e = np.exp(-np.abs(f))
+        p[pos] = e[pos] / (1.0 + e[pos])
+        p[~pos] = 1.0 / (1.0 + e[~pos])
+        return np.clip(p, MIN_PROB, 1 - MIN_PROB)
+
+    def predict_proba(self, X):
+        dec = self.decision_function(X)
+        pair_p = self._pairwise_prob(dec)
+        # sklearn 附带的 libsvm 对二分类同样做概率耦合
+        k = self.n_classes
+        n = len(dec)
+        r = np.zeros((n, k, k))
+        for p, (i, j) in enumerate(self.pairs):
+            r[:, i, j] = pair_p[:, p]
+            r[:, j, i] = 1 - pair_p[:, p]
+        return _multiclass_probability(r)
+
+    def predict(self, X):
+        return np.argmax(self.predict_proba(X), axis=1)
+
+
+def _multiclass_probability(r):
+    """libsvm multiclass_probability（Wu, Lin & Weng 方法二），按样本向量化"""
+    n, k, _ = r.shape
+    Q = -r.transpose(0, 2, 1) * r
+    diag = np.einsum('nji,nji->ni', r, r) - np.einsum('nii,nii->ni', r, r)
+    idx = np.arange(k)
+    Q[:, idx, idx] = diag
+
+    p = np.full((n, k), 1.0 / k)
+    active = np.ones(n, dtype=bool)
+    eps = 0.005 / k
+    for _ in range(max(100, k)):
+        a = np.flatnonzero(active)
+        if len(a) == 0:
+            break
+        Qa, pa = Q[a], p[a]
+        Qp = np.einsum('ntj,nj->nt', Qa, pa)
+        pQp = np.einsum('nt,nt->n', pa, Qp)
+        converged = np.abs(Qp - pQp[:, None]).max(axis=1) < eps
+        active[a[converged]] = False
+        keep = ~converged
+        a, Qa, pa, Qp, pQp = a[keep], Qa[keep], pa[keep], Qp[keep], pQp[keep]
+        for t in range(k):
+            qtt = Qa[:, t, t]
+            diff = (-Qp[:, t] + pQp) / qtt
+            pa[:, t] += diff
+            pQp = (pQp + diff * (diff * qtt + 2 * Qp[:, t])) / (1 + diff) / (1 + diff)
+            Qp = (Qp + diff[:, None] * Qa[:, t, :]) / (1 + diff)[:, None]
+            pa /= (1 + diff)[:, None]
+        p[a] = pa
+    return p
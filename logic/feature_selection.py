@@ -0,0 +1,104 @@
+"""
+特征排名与特征数自动选择
+
+用线性 SVM 做一次完整的 RFE（淘汰到只剩 1 个特征），得到所有特征的淘汰排名，
+按数据集内容（X、y、sample_weight 的哈希）缓存，同一份数据重复训练时不再重算。
+之后对每个特征数 k 取排名前 k 的特征，并行计算 RBF SVM 的交叉验证准确率；
+拐点取准确率与最佳值相差不超过 tolerance 的最小 k。
+选择结果为 RankedFeatureSelector，可像 RFE 一样 transform 并随模型保存。
+"""
+import hashlib
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.base import BaseEstimator, clone
+from sklearn.feature_selection import RFE, SelectorMixin
+from sklearn.model_selection import cross_val_score
+from sklearn.svm import SVC
+
+
+class RankedFeatureSelector(SelectorMixin, BaseEstimator):
+    """按 RFE 排名取前 n_features 个特征，可替代 RFE 用于 transform"""
+
+    def __init__(self, ranking=None, n_features: int = 5):
+        self.ranking = ranking
+        self.n_features = n_features
+
+    def fit(self, X, y=None):
+        self.ranking_ = np.asarray(self.ranking, dtype=int)
+        self.n_features_in_ = len(self.ranking_)
+        self.support_ = self.ranking_ <= self.n_features
+        return self
+
+    def _get_support_mask(self):
+        return self.support_
+
+
+def _cv_accuracy(estimator, X, y, cv, sample_weight=None):
+    params = None if sample_weight is None else {'sample_weight': sample_weight}
+    scores = cross_val_score(clone(estimator), X, y, cv=cv, scoring='accuracy', n_jobs=1, params=params)
+    return scores.mean(), scores.std()
+
+
+class FeatureSelectionEngine:
+    """
+    一次性计算完整的 RFE 淘汰排名（每个数据集缓存一次），
+    再并行评估每个特征数下的交叉验证准确率，自动选取拐点。
+    """
+
+    def __init__(self, cv: int = 5, tolerance: float = 0.01, n_jobs: int = -1):
+        self.cv = cv
+        self.tolerance = tolerance  # 与最佳准确率相差不超过该值即视为进入平台
+        self.n_jobs = n_jobs
+        self.rank_estimator = SVC(kernel='linear', C=1.0, random_state=42)
+        self.score_estimator = SVC(random_state=42)
+        self._ranking_cache = {}
+        self.ranking_ = None
+        self.cv_scores_ = []  # [(特征数, 平均准确率, 标准差)]
+        self.n_features_ = None
+
+    @staticmethod
+    def _dataset_key(X, y, sample_weight=None):
+        h = hashlib.sha1()
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        h.update(str(X.shape).encode())
+        h.update(X.tobytes())
+        h.update(np.ascontiguousarray(y).tobytes())
+        if sample_weight is not None:
+            h.update(np.ascontiguousarray(sample_weight, dtype=np.float64).tobytes())
+        return h.hexdigest()
+
+    def rank(self, X, y, sample_weight=None) -> np.ndarray:
+        """完整淘汰路径：排名 1 为最后保留的特征"""
+        key = self._dataset_key(X, y, sample_weight)
+        if key not in self._ranking_cache:
+            rfe = RFE(estimator=clone(self.rank_estimator), n_features_to_select=1)
+            if sample_weight is None:
+                rfe.fit(X, y)
+            else:
+                rfe.fit(X, y, sample_weight=sample_weight)
+            self._ranking_cache[key] = rfe.ranking_.copy()
+        return self._ranking_cache[key]
+
+    def score_path(self, X, y, ranking, sample_weight=None) -> list:
+        X = np.asarray(X)
+        counts = range(1, len(ranking) + 1)
+        results = Parallel(n_jobs=self.n_jobs)(
+            delayed(_cv_accuracy)(self.score_estimator, X[:, ranking <= k], y, self.cv, sample_weight)
+            for k in counts
+        )
+        return [(k, float(mean), float(std)) for k, (mean, std) in zip(counts, results)]
+
+    def pick_knee(self, cv_scores) -> int:
+        best = max(mean for _, mean, _ in cv_scores)
+        for k, mean, _ in cv_scores:
+            if mean >= best - self.tolerance:
+                return k
+        return cv_scores[-1][0]
+
+    def select(self, X, y, n_features: int = None, sample_weight=None) -> RankedFeatureSelector:
+        """n_features 为 None 时自动选取拐点"""
+        self.ranking_ = self.rank(X, y, sample_weight)
+        self.cv_scores_ = self.score_path(X, y, self.ranking_, sample_weight)
+        self.n_features_ = n_features if n_features is not None else self.pick_knee(self.cv_scores_)
+        selector = RankedFeatureSelector(self.ranking_, self.n_features_)
+        return selector.fit(X, y)
@@ -0,0 +1,310 @@
+"""
+扁平化随机森林推理
+
+把训练好的 RandomForestClassifier 中所有树导出为连续的节点数组（特征、阈值、右子节点、
+叶子概率），可按目录保存为 .npy 并以内存映射方式加载。每棵树按层序编号，兄弟节点相邻
+（左子节点 = 右子节点 + 1），叶子指向自身，因此下降时不必逐层判断是否已到达叶子。
+小批量把所有 (样本, 树) 组合一起按层下降；大批量按缓存大小的块逐棵树遍历，前几层按列
+比较后查表，其余各层循环次数以该树的最大深度为界，到达叶子的样本过半后才压缩出去。
+结果与 sklearn 的 predict_proba 完全一致。
+
+sklearn 先把输入转为 float32 再与 float64 阈值比较，因此把阈值向下取整到 float32
+不会改变任何比较结果；可选的量化模式把每个特征的阈值替换为其在该特征所有阈值中的
+序号（uint16），输入同样按 searchsorted 编码，比较结果依然完全相同。
+"""
+import os
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from logic.fast_svm import unwrap_estimator
+
+# 前几层按列比较一次算出（补成满二叉树后查表），之后逐层下降
+TOP_LEVELS = 3
+# (样本数 × 树数) 不超过该值时所有组合一起按层下降，更大时按块逐棵树遍历
+SMALL_BATCH_PAIRS = 1 << 19
+
+_ARRAYS = ["feature", "threshold", "right", "leaf_index", "roots", "depth", "leaf_value"]
+
+
+def _round_down_float32(t):
+    t32 = t.astype(np.float32)
+    too_big = t32.astype(np.float64) > t
+    t32[too_big] = np.nextafter(t32[too_big], np.float32(-np.inf))
+    return t32
+
+
+def _level_order(tree):
+    """按层序排列节点，每个内部节点的右、左子节点相邻。返回 (原节点顺序, 最大深度)"""
+    levels, frontier = [], np.zeros(1, dtype=np.int64)
+    while len(frontier):
+        levels.append(frontier)
+        internal = frontier[tree.children_left[frontier] != -1]
+        frontier = np.column_stack([tree.children_right[internal],
+                                    tree.children_left[internal]]).ravel()
+    return np.concatenate(levels), len(levels) - 1
+
+
+class FlatForest:
+    def __init__(self, feature, threshold, right, leaf_index, roots, depth, leaf_value, bin_edges=None):
+        self.feature = feature        # (n_nodes,) 分裂特征
+        self.threshold = threshold    # (n_nodes,) float32 阈值，量化模式下为 uint16 序号
+        self.right = right            # (n_nodes,) 右子节点，左子节点为 right + 1；叶子指向自身
+        self.leaf_index = leaf_index  # (n_nodes,) 叶子在 leaf_value 中的行，内部节点为 -1
+        self.roots = roots            # (n_trees,) 每棵树的根节点
+        self.depth = depth            # (n_trees,) 每棵树的最大深度
+        self.leaf_value = leaf_value  # (n_leaves, n_classes) 叶子的类别概率
+        self.bin_edges = bin_edges    # 量化模式下每个特征的有序阈值列表
+        self._tables = None
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def quantized(self):
+        return self.bin_edges is not None
+
+    @classmethod
+    def from_sklearn(cls, forest, quantize: bool = False):
+        forest = unwrap_estimator(forest)
+        if not isinstance(forest, RandomForestClassifier):
+            raise TypeError(f"不支持的模型类型：{type(forest).__name__}")
+        if forest.n_outputs_ != 1:
+            raise ValueError("只支持单输出的随机森林")
+
+        features, thresholds, rights, leaf_ids, roots, depths, leaves = [], [], [], [], [], [], []
+        n_nodes = n_leaves = 0
+        for est in forest.estimators_:
+            tree = est.tree_
+            order, depth = _level_order(tree)
+            new_id = np.empty(tree.node_count, dtype=np.int64)
+            new_id[order] = n_nodes + np.arange(tree.node_count)
+            is_leaf = tree.children_left[order] == -1
+
+            leaf_id = np.full(tree.node_count, -1, dtype=np.int64)
+            leaf_id[is_leaf] = n_leaves + np.arange(is_leaf.sum())
+            value = tree.value[order[is_leaf], 0, :].astype(np.float64)
+            normalizer = value.sum(axis=1, keepdims=True)
+            # 新版 sklearn 的 value 已是比例，predict_proba 直接使用；旧版为计数，需要归一化
+            if not np.allclose(normalizer, 1.0):
+                normalizer[normalizer == 0] = 1.0
+                value = value / normalizer
+            leaves.append(value)
+
+            features.append(np.where(is_leaf, 0, tree.feature[order]))
+            thresholds.append(np.where(is_leaf, 0.0, tree.threshold[order]))
+            rights.append(np.where(is_leaf, new_id[order], new_id[tree.children_right[order]]))
+            leaf_ids.append(leaf_id)
+            roots.append(n_nodes)
+            depths.append(depth)
+            n_nodes += tree.node_count
+            n_leaves += int(is_leaf.sum())
+
+        feature = np.concatenate(features)
+        feature = feature.astype(np.uint8 if forest.n_features_in_ <= 256 else np.int32)
+        flat = cls(
+            feature,
+            _round_down_float32(np.concatenate(thresholds)),
+            np.concatenate(rights).astype(np.int32),
+            np.concatenate(leaf_ids).astype(np.int32),
+            np.asarray(roots, dtype=np.int32),
+            np.asarray(depths, dtype=np.int32),
+            np.concatenate(leaves),
+        )
+        return flat.quantize() if quantize else flat
+
+    def quantize(self):
+        """阈值改存为每个特征内的序号（uint16）"""
+        if self.quantized:
+            return self
+        internal = self.leaf_index < 0
+        n_features = int(self.feature[internal].max()) + 1 if internal.any() else 1
+        edges, codes = [], np.zeros(len(self.threshold), dtype=np.uint16)
+        for f in range(n_features):
+            mask = internal & (self.feature == f)
+            u = np.unique(self.threshold[mask])
+            if len(u) > np.iinfo(np.uint16).max:
+                raise ValueError(f"特征 {f} 的阈值过多，无法量化")
+            codes[mask] = np.searchsorted(u, self.threshold[mask])
+            edges.append(u)
+        return FlatForest(self.feature, codes, self.right, self.leaf_index, self.roots,
+                          self.depth, self.leaf_value, edges)
+
+    def _encode(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        if not self.quantized:
+            return np.ascontiguousarray(X)
+        # x <= 第 k 个阈值 ⇔ 小于 x 的阈值个数 <= k；序号不超过 65535，float32 可精确表示
+        codes = np.zeros(X.shape, dtype=np.float32)
+        for f, edges in enumerate(self.bin_edges):
+            codes[:, f] = np.searchsorted(edges, X[:, f], side='left')
+        return codes
+
+    def _runtime_tables(self):
+        """
+        遍历用的节点表：code = (右子节点 << bits) | 特征，一次 take 取出两者；
+        阈值为 float32，叶子为 NaN（比较恒为假，停在自身）。
+        另为每棵树把前 TOP_LEVELS 层补成满二叉树（叶子的两个子节点都指向自身），
+        整块样本按列比较后拼成位码，查表直接得到第 TOP_LEVELS 层的节点。
+        """
+        if self._tables is not None:
+            return self._tables
+        feature = np.asarray(self.feature, dtype=np.intp)
+        right = np.asarray(self.right, dtype=np.intp)
+        is_leaf = np.asarray(self.leaf_index) >= 0
+        threshold = np.asarray(self.threshold, dtype=np.float32).copy()
+        threshold[is_leaf] = np.nan
+        bits = max(int(feature.max()), 1).bit_length()
+        code = (right << bits) | feature
+
+        n_slots = (1 << TOP_LEVELS) - 1
+        top_feature = np.zeros((self.n_trees, n_slots), dtype=np.intp)
+        top_threshold = np.zeros((self.n_trees, n_slots), dtype=np.float32)
+        top_node = np.zeros((self.n_trees, 2 * n_slots + 1), dtype=np.intp)
+        top_node[:, 0] = self.roots
+        for s in range(n_slots):
+            n = top_node[:, s]
+            top_feature[:, s] = feature[n]
+            top_threshold[:, s] = np.where(is_leaf[n], 0, threshold[n])
+            # 左子节点 = right + 1，叶子的两个子节点都是自身
+            top_node[:, 2 * s + 1] = np.where(is_leaf[n], n, right[n] + 1)
+            top_node[:, 2 * s + 2] = np.where(is_leaf[n], n, right[n])
+        # 位码第 s 位为 1 表示第 s 个槽位的比较为真（向左）
+        codes = np.arange(1 << n_slots)
+        slot = np.zeros(len(codes), dtype=np.intp)
+        for _ in range(TOP_LEVELS):
+            slot = 2 * slot + 2 - ((codes >> slot) & 1)
+        top_lut = top_node[:, slot]
+
+        self._tables = (code, bits, threshold, top_feature, top_threshold, top_lut)
+        return self._tables
+
+    def _descend(self, node, rows, depth, x_flat, out):
+        """
+        node / rows 为起始节点与样本在 x_flat 中的行偏移，同步下降 depth 层，
+        到达的叶子节点写入 out（与 node 等长）
+        """
+        code, bits, threshold = self._runtime_tables()[:3]
+        mask = (1 << bits) - 1
+        n = len(node)
+        slot = None
+        for level in range(1, depth + 1):
+            if level == 1 or len(node) != len(word):
+                k = len(node)
+                nxt, word, index = (np.empty(k, dtype=np.intp) for _ in range(3))
+                x, thr = np.empty(k, dtype=np.float32), np.empty(k, dtype=np.float32)
+                go_left = np.empty(k, dtype=bool)
+            # 下标总在范围内，wrap 模式省去越界检查
+            code.take(node, out=word, mode='wrap')
+            np.bitwise_and(word, mask, out=index)
+            np.add(index, rows, out=index)
+            x_flat.take(index, out=x, mode='wrap')
+            threshold.take(node, out=thr, mode='wrap')
+            np.less_equal(x, thr, out=go_left)
+            np.right_shift(word, bits, out=nxt)
+            np.add(nxt, go_left, out=nxt)
+            node, nxt = nxt, node
+            if level == depth or level % 3:
+                continue
+            # 到达叶子的样本原地打转；每三层检查一次，过半到达后才压缩，压缩本身比多走几层更贵
+            same = node == nxt
+            if np.count_nonzero(same) * 2 >= len(node):
+                if slot is None:
+                    slot = np.arange(n, dtype=np.intp)
+                out[slot] = node
+                keep = np.flatnonzero(~same)
+                if len(keep) == 0:
+                    return
+                node, slot, rows = node.take(keep), slot.take(keep), rows.take(keep)
+        if slot is None:
+            out[:] = node
+        else:
+            out[slot] = node
+
+    def _top_nodes(self, t, columns, out):
+        """第 t 棵树的前 TOP_LEVELS 层：columns 为按列存放的 (n_features, m) 输入"""
+        top_feature, top_threshold, top_lut = self._runtime_tables()[3:]
+        bit = np.empty(columns.shape[1], dtype=bool)
+        packed = np.zeros(columns.shape[1], dtype=np.uint8)
+        # 从最高位开始：packed = packed * 2 + bit
+        for s in reversed(range(top_feature.shape[1])):
+            np.less_equal(columns[top_feature[t, s]], top_threshold[t, s], out=bit)
+            np.add(packed, packed, out=packed)
+            np.bitwise_or(packed, bit.view(np.uint8), out=packed)
+        np.take(top_lut[t], packed.astype(np.intp), out=out, mode='wrap')
+
+    def apply(self, X, chunk_size: int = 16384):
+        """返回每个 (样本, 树) 落入的叶子编号，形状 (n_samples, n_trees)"""
+        return self._leaf_nodes(X, chunk_size, reduce=False)
+
+    def predict_proba(self, X, chunk_size: int = 16384):
+        """与 sklearn 相同：按树的顺序逐棵累加叶子概率后再除以树的数量"""
+        return self._leaf_nodes(X, chunk_size, reduce=True)
+
+    def _leaf_nodes(self, X, chunk_size, reduce):
+        Xc = self._encode(X)
+        n, n_features = Xc.shape
+        n_classes = self.leaf_value.shape[1]
+        out = np.empty((n, n_classes) if reduce else (n, self.n_trees),
+                       dtype=np.float64 if reduce else np.intp)
+        for s in range(0, n, chunk_size):
+            chunk = Xc[s:s + chunk_size]
+            m = len(chunk)
+            x_flat = chunk.ravel()
+            if m * self.n_trees <= SMALL_BATCH_PAIRS:
+                # 小批量：所有 (样本, 树) 组合一起按层下降，Python 循环次数只与最大深度有关
+                node = np.empty(m * self.n_trees, dtype=np.intp)
+                self._descend(np.tile(np.asarray(self.roots, dtype=np.intp), m),
+                              np.repeat(np.arange(m, dtype=np.intp) * n_features, self.n_trees),
+                              int(self.depth.max()), x_flat, node)
+                leaves = self.leaf_index.take(node).reshape(m, self.n_trees)
+                if not reduce:
+                    out[s:s + m] = leaves
+                    continue
+                acc = np.zeros((m, n_classes), dtype=np.float64)
+                for t in range(self.n_trees):
+                    acc += self.leaf_value.take(leaves[:, t], axis=0)
+                out[s:s + m] = acc / self.n_trees
+                continue
+
+            # 大批量：逐棵树遍历整块，节点表小、留在缓存中
+            columns = np.ascontiguousarray(chunk.T)
+            rows = np.arange(m, dtype=np.intp) * n_features
+            start = np.empty(m, dtype=np.intp)
+            node = np.empty(m, dtype=np.intp)
+            acc = np.zeros((m, n_classes), dtype=np.float64) if reduce else None
+            for t in range(self.n_trees):
+                self._top_nodes(t, columns, start)
+                self._descend(start, rows, max(int(self.depth[t]) - TOP_LEVELS, 0), x_flat, node)
+                leaves = self.leaf_index.take(node)
+                if reduce:
+                    acc += self.leaf_value.take(leaves, axis=0)
+                else:
+                    out[s:s + m, t] = leaves
+            if reduce:
+                out[s:s + m] = acc / self.n_trees
+        return out
+
+    def predict(self, X):
+        return np.argmax(self.predict_proba(X), axis=1)
+
+    def save(self, folder_path: str):
+        os.makedirs(folder_path, exist_ok=True)
+        for name in _ARRAYS:
+            np.save(os.path.join(folder_path, f"{name}.npy"), getattr(self, name))
+        if self.quantized:
+            lengths = np.array([len(e) for e in self.bin_edges], dtype=np.int64)
+            np.save(os.path.join(folder_path, "bin_lengths.npy"), lengths)
+            np.save(os.path.join(folder_path, "bin_edges.npy"), np.concatenate(self.bin_edges))
+
+    @classmethod
+    def load(cls, folder_path: str, mmap: bool = True):
+        mode = 'r' if mmap else None
+        arrays = {name: np.load(os.path.join(folder_path, f"{name}.npy"), mmap_mode=mode)
+                  for name in _ARRAYS}
+        bin_edges = None
+        lengths_path = os.path.join(folder_path, "bin_lengths.npy")
+        if os.path.exists(lengths_path):
+            lengths = np.load(lengths_path)
+            flat_edges = np.load(os.path.join(folder_path, "bin_edges.npy"))
+            bin_edges = np.split(flat_edges, np.cumsum(lengths)[:-1])
+        return cls(bin_edges=bin_edges, **arrays)
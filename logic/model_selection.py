@@ -0,0 +1,145 @@
+"""
+按推理延迟预算选择模型
+
+对多个候选模型族分别做交叉验证并测量推理耗时（整图批量预测的每样本微秒数、
+单次点击预测的毫秒数），给出准确率/延迟的 Pareto 前沿，并在预算内选出
+交叉验证准确率最高的模型。耗时按 GraphenePredictor 实际的推理路径测量
+（批量 SVM 推理、扁平化随机森林等），与保存后预测时的速度一致。
+"""
+import time
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.discriminant_analysis import LinearDiscriminantAnalysis, QuadraticDiscriminantAnalysis
+from sklearn.ensemble import VotingClassifier, HistGradientBoostingClassifier
+from sklearn.model_selection import StratifiedKFold
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.utils.validation import has_fit_parameter
+
+from logic.predictor import GraphenePredictor
+
+ENSEMBLE = "SVM+RF 集成"
+
+
+def build_candidates(svm, rf) -> dict:
+    """svm / rf 为调参后的最佳模型（未拟合或已拟合均可）"""
+    return {
+        ENSEMBLE: VotingClassifier(estimators=[('svm', clone(svm)), ('rf', clone(rf))], voting='soft'),
+        "SVM": clone(svm),
+        "RF": clone(rf),
+        "LDA": LinearDiscriminantAnalysis(),
+        "QDA": QuadraticDiscriminantAnalysis(reg_param=0.01),
+        "k-NN": KNeighborsClassifier(n_neighbors=5),
+        "HistGB": HistGradientBoostingClassifier(random_state=42),
+    }
+
+
+def fit_weighted(estimator, X, y, sample_weight=None):
+    """不支持 sample_weight 的模型按计数重复样本后拟合"""
+    if sample_weight is None:
+        return estimator.fit(X, y)
+    if has_fit_parameter(estimator, 'sample_weight'):
+        return estimator.fit(X, y, sample_weight=sample_weight)
+    reps = np.maximum(np.round(sample_weight).astype(int), 1)
+    return estimator.fit(np.repeat(X, reps, axis=0), np.repeat(y, reps))
+
+
+def _fold_accuracy(estimator, X, y, sample_weight, train, test):
+    w = None if sample_weight is None else sample_weight[train]
+    est = fit_weighted(clone(estimator), X[train], y[train], w)
+    return float(np.mean(est.predict(X[test]) == y[test]))
+
+
+def inference_proba(model):
+    """与加载后的 GraphenePredictor 相同的 predict_proba（输入为选中的特征）"""
+    predictor = GraphenePredictor()
+    predictor.use_model(model)
+    return predictor.ensemble_proba
+
+
+def benchmark_latency(model, X, batch_size: int = 10000, repeats: int = 3):
+    """返回 (批量预测每样本微秒数, 单次 1 个样本预测毫秒数)"""
+    predict_proba = inference_proba(model)
+    rng = np.random.default_rng(0)
+    batch = X[rng.integers(0, len(X), batch_size)]
+    best = np.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        predict_proba(batch)
+        best = min(best, time.perf_counter() - start)
+
+    single = []
+    for i in range(20):
+        start = time.perf_counter()
+        predict_proba(X[i % len(X):i % len(X) + 1])
+        single.append(time.perf_counter() - start)
+    return best / batch_size * 1e6, float(np.median(single)) * 1e3
+
+
+def pareto_front(results: list) -> list:
+    """准确率更高且批量延迟更低者占优，返回未被占优的候选名"""
+    front = []
+    for r in results:
+        dominated = any(
+            o["cv_accuracy"] >= r["cv_accuracy"] and o["batch_us"] <= r["batch_us"]
+            and (o["cv_accuracy"] > r["cv_accuracy"] or o["batch_us"] < r["batch_us"])
+            for o in results
+        )
+        if not dominated:
+            front.append(r["name"])
+    return front
+
+
+def compare_models(candidates: dict, X, y, sample_weight=None, cv: int = 5,
+                   batch_size: int = 10000, n_jobs: int = -1) -> list:
+    """
+    所有候选在相同的分层折上做交叉验证，然后在全部数据上拟合并测量延迟。
+    返回 [{name, model, cv_accuracy, batch_us, single_ms}]。
+    """
+    X, y = np.asarray(X), np.asarray(y)
+    splits = list(StratifiedKFold(n_splits=cv).split(X, y))
+    names = list(candidates)
+    scores = Parallel(n_jobs=n_jobs)(
+        delayed(_fold_accuracy)(candidates[name], X, y, sample_weight, train, test)
+        for name in names
+        for train, test in splits
+    )
+    scores = np.array(scores).reshape(len(names), len(splits))
+
+    results = []
+    for name, fold_scores in zip(names, scores):
+        model = fit_weighted(clone(candidates[name]), X, y, sample_weight)
+        batch_us, single_ms = benchmark_latency(model, X, batch_size)
+        results.append({
+            "name": name,
+            "model": model,
+            "cv_accuracy": float(fold_scores.mean()),
+            "batch_us": batch_us,
+            "single_ms": single_ms,
+        })
+    return results
+
+
+def select_within_budget(results: list, latency_budget_us: float = None):
+    """
+    预算内交叉验证准确率最高的候选；没有预算时保留集成模型；
+    所有候选都超出预算时退而选择最快的一个。返回 (候选, 是否满足预算)。
+    """
+    if latency_budget_us is None:
+        return next(r for r in results if r["name"] == ENSEMBLE), True
+    fits = [r for r in results if r["batch_us"] <= latency_budget_us]
+    if not fits:
+        return min(results, key=lambda r: r["batch_us"]), False
+    return max(fits, key=lambda r: (r["cv_accuracy"], -r["batch_us"])), True
+
+
+def format_results(results: list, chosen_name: str) -> str:
+    front = set(pareto_front(results))
+    lines = [f"{'模型':<12}{'交叉验证准确率':>10}{'批量 µs/样本':>14}{'单次 ms':>10}"]
+    for r in sorted(results, key=lambda r: r["batch_us"]):
+        mark = ("★" if r["name"] == chosen_name else "") + ("P" if r["name"] in front else "")
+        lines.append(
+            f"{r['name']:<12}{r['cv_accuracy'] * 100:>13.2f}%{r['batch_us']:>14.2f}{r['single_ms']:>10.2f}  {mark}"
+        )
+    lines.append("（★ 为保存的模型，P 为准确率/延迟 Pareto 前沿）")
+    return "\n".join(lines)
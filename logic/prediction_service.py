@@ -0,0 +1,296 @@
+"""
+本地预测服务
+
+常驻进程，模型加载后保留在内存中，多个客户端（各显微镜工位的 GUI）通过
+multiprocessing.connection 提交点对或图像区域预测请求。服务端在很短的时间窗口内
+把并发请求合并为一个批次，再统一调用集成模型：
+
+    python -m logic.prediction_service --models models --address 127.0.0.1:6200
+
+未指定密钥时只能监听本机回环地址，并在启动时打印随机生成的密钥，客户端需使用该密钥连接。
+"""
+import argparse
+import os
+import queue
+import threading
+import time
+from collections import deque
+from multiprocessing.connection import Listener, Client
+
+import numpy as np
+
+from logic.predictor import GraphenePredictor
+from logic.distributed_search import parse_address, listener_authkey
+
+DEFAULT_ADDRESS = ("127.0.0.1", 6200)
+
+
+class _Request:
+    def __init__(self, model: str, rgb1: np.ndarray, rgb2: np.ndarray):
+        self.model = model
+        self.rgb1 = rgb1
+        self.rgb2 = rgb2
+        self.rows = len(rgb1)
+        self.arrived = time.perf_counter()
+        self.done = threading.Event()
+        self.labels = None
+        self.proba = None
+        self.error = None
+
+
+class PredictionService:
+    """模型常驻内存，按时间窗口合并请求后批量预测"""
+
+    def __init__(self, model_root: str = "models", address=DEFAULT_ADDRESS,
+                 authkey: bytes = None, batch_window: float = 0.005,
+                 max_batch_rows: int = 65536):
+        self.model_root = model_root
+        self.address = tuple(address)
+        self.authkey = listener_authkey(self.address, authkey)
+        self.generated_authkey = not authkey  # 随机生成的密钥需要告知客户端
+        self.batch_window = batch_window  # 收到第一个请求后最多等待的秒数
+        self.max_batch_rows = max_batch_rows
+        self._predictors = {}
+        self._model_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._closed = False
+        self._listener = None
+
+        # 统计
+        self._stats_lock = threading.Lock()
+        self._started = time.perf_counter()
+        self._n_requests = 0
+        self._n_rows = 0
+        self._n_batches = 0
+        self._latencies = deque(maxlen=1000)
+
+    # ---------- 模型管理 ----------
+    def get_predictor(self, model: str) -> GraphenePredictor:
+        with self._model_lock:
+            if model not in self._predictors:
+                predictor = GraphenePredictor()
+                if not predictor.load_model(os.path.join(self.model_root, model)):
+                    raise RuntimeError(f"模型加载失败：{model}")
+                self._predictors[model] = predictor
+            return self._predictors[model]
+
+    def reload(self, model: str):
+        """重新从磁盘加载模型（用于发布新版本）"""
+        with self._model_lock:
+            self._predictors.pop(model, None)
+        self.get_predictor(model)
+
+    # ---------- 请求入口 ----------
+    def submit(self, model: str, rgb1, rgb2) -> _Request:
+        rgb1 = np.asarray(rgb1, dtype=np.uint8).reshape(-1, 3)
+        rgb2 = np.asarray(rgb2, dtype=np.uint8).reshape(-1, 3)
+        req = _Request(model, rgb1, rgb2)
+        self._queue.put(req)
+        return req
+
+    def predict(self, model: str, rgb1, rgb2):
+        req = self.submit(model, rgb1, rgb2)
+        req.done.wait()
+        if req.error is not None:
+            raise RuntimeError(req.error)
+        return req.labels, req.proba
+
+    def predict_region(self, model: str, region, substrate_rgb):
+        """对图像区域逐像素预测，substrate_rgb 为衬底颜色"""
+        region = np.asarray(region, dtype=np.uint8)
+        h, w, _ = region.shape
+        rgb1 = region.reshape(-1, 3)
+        rgb2 = np.broadcast_to(np.asarray(substrate_rgb, dtype=np.uint8), rgb1.shape)
+        labels, proba = self.predict(model, rgb1, rgb2)
+        return labels.reshape(h, w), proba.reshape(h, w, -1)
+
+    # ---------- 批处理 ----------
+    def _batch_loop(self):
+        while not self._closed:
+            try:
+                first = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            batch = [first]
+            rows = first.rows
+            deadline = time.perf_counter() + self.batch_window
+            while rows < self.max_batch_rows:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    req = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(req)
+                rows += req.rows
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        start = time.perf_counter()
+        by_model = {}
+        for req in batch:
+            by_model.setdefault(req.model, []).append(req)
+
+        for model, reqs in by_model.items():
+            try:
+                predictor = self.get_predictor(model)
+                rgb1 = np.concatenate([r.rgb1 for r in reqs])
+                rgb2 = np.concatenate([r.rgb2 for r in reqs])
+                labels, proba = predictor.predict_rgb(rgb1, rgb2)
+                offset = 0
+                for r in reqs:
+                    r.labels = labels[offset:offset + r.rows]
+                    r.proba = proba[offset:offset + r.rows]
+                    offset += r.rows
+            except Exception as e:
+                for r in reqs:
+                    r.error = str(e)
+
+        with self._stats_lock:
+            self._n_batches += 1
+            self._n_requests += len(batch)
+            self._n_rows += sum(r.rows for r in batch)
+            self._latencies.extend(start - r.arrived for r in batch)
+        for r in batch:
+            r.done.set()
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            elapsed = time.perf_counter() - self._started
+            latencies = np.array(self._latencies) if self._latencies else np.zeros(1)
+            return {
+                "requests": self._n_requests,
+                "rows": self._n_rows,
+                "batches": self._n_batches,
+                "mean_batch_requests": self._n_requests / max(self._n_batches, 1),
+                "rows_per_second": self._n_rows / elapsed if elapsed > 0 else 0.0,
+                "queue_latency_ms_mean": float(latencies.mean() * 1000),
+                "queue_latency_ms_p95": float(np.percentile(latencies, 95) * 1000),
+                "models": sorted(self._predictors),
+            }
+
+    # ---------- 网络 ----------
+    def start(self):
+        self._listener = Listener(self.address, backlog=64, authkey=self.authkey)
+        self.address = self._listener.address
+        threading.Thread(target=self._batch_loop, daemon=True).start()
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+
+    def close(self):
+        self._closed = True
+        if self._listener is not None:
+            self._listener.close()
+
+    def serve_forever(self):
+        self.start()
+        print(f"预测服务已启动：{self.address[0]}:{self.address[1]}")
+        if self.generated_authkey:
+            print(f"本次随机生成的密钥：{self.authkey.decode()}（客户端设置 GRAPHENE_PREDICT_AUTHKEY 后连接）")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            self.close()
+
+    def _accept_loop(self):
+        while not self._closed:
+            try:
+                conn = self._listener.accept()
+            except Exception:
+                if self._closed:
+                    break
+                continue
+            threading.Thread(target=self._serve_client, args=(conn,), daemon=True).start()
+
+    def _serve_client(self, conn):
+        # 每条消息为 (命令, 参数...)，返回 ("ok", 结果...) 或 ("error", 信息)
+        with conn:
+            while True:
+                try:
+                    msg = conn.recv()
+                except (EOFError, OSError):
+                    break
+                try:
+                    kind = msg[0]
+                    if kind == "predict":
+                        reply = ("ok",) + self.predict(*msg[1:])
+                    elif kind == "predict_region":
+                        reply = ("ok",) + self.predict_region(*msg[1:])
+                    elif kind == "classes":
+                        reply = ("ok", self.get_predictor(msg[1]).label_encoder.classes_)
+                    elif kind == "reload":
+                        self.reload(msg[1])
+                        reply = ("ok",)
+                    elif kind == "stats":
+                        reply = ("ok", self.stats())
+                    else:
+                        reply = ("error", f"未知命令：{kind}")
+                except Exception as e:
+                    reply = ("error", str(e))
+                try:
+                    conn.send(reply)
+                except (EOFError, OSError):
+                    break
+
+
+class PredictionClient:
+    """连接本地预测服务的客户端"""
+
+    def __init__(self, address=DEFAULT_ADDRESS, authkey: bytes = None):
+        if not authkey:
+            raise ValueError("未指定预测服务的密钥")
+        self._conn = Client(tuple(address), authkey=authkey)
+        self._lock = threading.Lock()
+
+    def _call(self, *msg):
+        with self._lock:
+            self._conn.send(msg)
+            reply = self._conn.recv()
+        if reply[0] != "ok":
+            raise RuntimeError(reply[1])
+        return reply[1:]
+
+    def predict(self, model: str, rgb1, rgb2):
+        labels, proba = self._call("predict", model,
+                                   np.asarray(rgb1, dtype=np.uint8), np.asarray(rgb2, dtype=np.uint8))
+        return labels, proba
+
+    def predict_region(self, model: str, region, substrate_rgb):
+        labels, proba = self._call("predict_region", model,
+                                   np.asarray(region, dtype=np.uint8), np.asarray(substrate_rgb, dtype=np.uint8))
+        return labels, proba
+
+    def classes(self, model: str):
+        return self._call("classes", model)[0]
+
+    def reload(self, model: str):
+        self._call("reload", model)
+
+    def stats(self) -> dict:
+        return self._call("stats")[0]
+
+    def close(self):
+        self._conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="石墨烯层数本地预测服务")
+    parser.add_argument("--models", default="models", help="模型根目录")
+    parser.add_argument("--address", default=f"{DEFAULT_ADDRESS[0]}:{DEFAULT_ADDRESS[1]}")
+    parser.add_argument("--authkey", default=os.environ.get("GRAPHENE_PREDICT_AUTHKEY"),
+                        help="连接密钥；不指定时只能监听本机地址并随机生成")
+    parser.add_argument("--window-ms", type=float, default=5.0, help="批处理等待窗口（毫秒）")
+    args = parser.parse_args()
+
+    authkey = args.authkey.encode() if args.authkey else None
+    try:
+        service = PredictionService(args.models, parse_address(args.address), authkey,
+                                    batch_window=args.window_ms / 1000)
+    except ValueError as e:
+        parser.error(f"{e}（使用 --authkey 或环境变量 GRAPHENE_PREDICT_AUTHKEY）")
+    service.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
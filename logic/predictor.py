@@ -3,6 +3,19 @@ import pickle
 import os
 import pandas as pd
 from collections import Counter
+from sklearn.ensemble import VotingClassifier, RandomForestClassifier
+from sklearn.svm import SVC
+from logic.fast_svm import BatchSVMEvaluator, unwrap_estimator
+from logic.flat_forest import FlatForest
+from logic.annotation_store import FEATURE_COLUMNS, pair_features
+from logic.utils import rgb_to_hsv
+
+# 单次预测行数达到该值时 SVM 改用向量化推理（整图预测等）
+FAST_PATH_MIN_ROWS = 4096
+# 行数少于该值时随机森林改用扁平化推理；约两千行以上两者持平，更大的批量交给 sklearn
+FLAT_FOREST_MAX_ROWS = 2048
+# 加载模型时用支持向量自检，与 sklearn 概率的最大允许差异
+FAST_PATH_TOLERANCE = 0.01
 
 class GraphenePredictor:
     def __init__(self):
@@ -11,6 +24,7 @@ class GraphenePredictor:
         self.model = None
         self.label_encoder = None
         self.feature_names = []
+        self.fast_members = None  # [(成员模型, 快速 predict_proba, 最少行数, 最多行数)]
         self.prediction_data = []  # 每组为 [(rgb1, hsv1), (rgb2, hsv2)]
 
     def load_model(self, folder_path: str = "models") -> bool:
@@ -25,73 +39,229 @@ class GraphenePredictor:
                 self.label_encoder = pickle.load(f)
             with open(os.path.join(folder_path, "features.pkl"), "rb") as f:
                 self.feature_names = pickle.load(f)
+            self._build_fast_path(folder_path)
             return True
         except Exception as e:
             print(f"模型加载失败: {e}")
             return False
 
+    def use_model(self, model, folder_path: str = None):
+        """直接使用内存中已拟合的模型（输入为选中的特征），构建与加载模型时相同的推理路径"""
+        self.model = model
+        self._build_fast_path(folder_path)
+
+    def _build_fast_path(self, folder_path: str = None):
+        """
+        为软投票集成的成员（或单独保存的 SVC / 随机森林）构建快速推理器：
+        SVC 用批量 SVM 推理（大批量），随机森林用扁平化节点数组（小批量到中等批量，
+        避免逐棵树调用 sklearn 的开销）。每个推理器加载时与 sklearn 对比自检，未通过则该成员仍用 sklearn。
+        其他模型（LDA、k-NN 等）直接调用其 predict_proba。
+        folder_path 为 None 时随机森林的节点数组直接从模型构建。
+        """
+        self.fast_members = None
+        if isinstance(self.model, VotingClassifier):
+            if self.model.voting != 'soft':
+                return
+            estimators = self.model.estimators_
+        elif isinstance(unwrap_estimator(self.model), (SVC, RandomForestClassifier)):
+            estimators = [self.model]
+        else:
+            return
+        members = []
+        for est in estimators:
+            inner = unwrap_estimator(est)
+            if isinstance(inner, SVC):
+                members.append((est, self._svm_fast_path(inner), FAST_PATH_MIN_ROWS, np.inf))
+            elif isinstance(inner, RandomForestClassifier):
+                members.append((est, self._forest_fast_path(inner, folder_path), 0, FLAT_FOREST_MAX_ROWS))
+            else:
+                members.append((est, None, 0, 0))
+        self.fast_members = members
+
+    @staticmethod
+    def _svm_fast_path(svc):
+        try:
+            evaluator = BatchSVMEvaluator.from_svc(svc)
+        except (TypeError, ValueError) as e:
+            print(f"批量 SVM 推理不可用: {e}")
+            return None
+        probe = svc.support_vectors_[:256]
+        error = np.abs(evaluator.predict_proba(probe) - svc.predict_proba(probe)).max()
+        if error > FAST_PATH_TOLERANCE:
+            print(f"批量 SVM 推理自检未通过（误差 {error:.4f}），使用 sklearn 推理")
+            return None
+        return evaluator.predict_proba
+
+    @staticmethod
+    def _forest_fast_path(forest, folder_path: str):
+        forest_dir = None if folder_path is None else os.path.join(folder_path, "forest")
+        flat = None
+        if forest_dir is not None and os.path.isdir(forest_dir):
+            try:
+                flat = FlatForest.load(forest_dir, mmap=True)
+            except (OSError, ValueError) as e:
+                # 旧格式的节点数组，改为从模型重新构建
+                print(f"加载扁平化随机森林失败: {e}")
+        try:
+            if flat is None:
+                flat = FlatForest.from_sklearn(forest)
+        except (TypeError, ValueError) as e:
+            print(f"扁平化随机森林不可用: {e}")
+            return None
+        probe = np.random.default_rng(0).normal(size=(256, forest.n_features_in_))
+        if not np.array_equal(flat.predict_proba(probe), forest.predict_proba(probe)):
+            print("扁平化随机森林自检未通过，使用 sklearn 推理")
+            return None
+        return flat.predict_proba
+
+    def ensemble_proba(self, X):
+        """选中特征上的类别概率，按行数在快速推理器与 sklearn 之间切换"""
+        if self.fast_members is None:
+            return self.model.predict_proba(X)
+        weights = self.model.weights if isinstance(self.model, VotingClassifier) else None
+        if weights is not None:
+            weights = [w for w, (_, est) in zip(weights, self.model.estimators) if est != 'drop']
+        n = len(X)
+        probas = [
+            fast(X) if fast is not None and lo <= n < hi else est.predict_proba(X)
+            for est, fast, lo, hi in self.fast_members
+        ]
+        return np.average(probas, axis=0, weights=weights)
+
     def reset(self):
         self.prediction_data.clear()
 
     def add_point_pair(self, rgb1, hsv1, rgb2, hsv2):
         self.prediction_data.append((rgb1, hsv1, rgb2, hsv2))
 
-    def _construct_feature_row(self, rgb1, hsv1, rgb2, hsv2):
-        r1, g1, b1 = map(int, rgb1)
-        h1, s1, v1 = hsv1
-        r2, g2, b2 = map(int, rgb2)
-        h2, s2, v2 = hsv2
-
-        def safe_div(a, b):
-            return float(a) / b if b != 0 else 0.0
-
-        features = {
-            "R1": r1, "G1": g1, "B1": b1,
-            "H1": h1, "S1": s1, "V1": v1,
-            "R2": r2, "G2": g2, "B2": b2,
-            "H2": h2, "S2": s2, "V2": v2,
-            "ratio_R": safe_div(r1, r2),
-            "ratio_G": safe_div(g1, g2),
-            "ratio_B": safe_div(b1, b2),
-            "ratio_H": safe_div(h1, h2),
-            "ratio_S": safe_div(s1, s2),
-            "ratio_V": safe_div(v1, v2),
-            "diff_R": abs(r1 - r2),
-            "diff_G": abs(g1 - g2),
-            "diff_B": abs(b1 - b2),
-            "diff_H": abs(h1 - h2),
-            "diff_S": abs(s1 - s2),
-            "diff_V": abs(v1 - v2),
+    def _construct_feature_matrix(self, rgb1, hsv1, rgb2, hsv2):
+        """按行批量构造特征，rgb 为 (n, 3) 数组，hsv 为归一化后的 (n, 3) 数组"""
+        X = pd.DataFrame(pair_features(rgb1, hsv1, rgb2, hsv2, signed=False), columns=FEATURE_COLUMNS)
+        # 与训练时的列顺序一致（通常就是 FEATURE_COLUMNS，无需复制）
+        return X if list(self.feature_names) == FEATURE_COLUMNS else X[self.feature_names]
+
+    def predict_rgb(self, rgb1, rgb2):
+        """对 (n, 3) 的 RGB 点对批量预测，返回 (层数标签, 概率矩阵)"""
+        X = self._construct_feature_matrix(rgb1, rgb_to_hsv(rgb1), rgb2, rgb_to_hsv(rgb2))
+        return self._predict_features(X)
+
+    def _predict_features(self, X):
+        X_scaled = self.scaler.transform(X)
+        X_selected = self.rfe.transform(X_scaled)
+        proba = self.ensemble_proba(X_selected)
+        labels = self.label_encoder.inverse_transform(np.argmax(proba, axis=1))
+        return labels, proba
+
+    def _predict_pixels(self, pixels, substrate_rgb, chunk_size: int = 262144):
+        """对 (n, 3) 像素逐个与衬底配对预测，返回类别下标"""
+        out = np.empty(len(pixels), dtype=np.int64)
+        for s in range(0, len(pixels), chunk_size):
+            chunk = pixels[s:s + chunk_size]
+            substrate = np.broadcast_to(np.asarray(substrate_rgb, dtype=np.uint8), chunk.shape)
+            X = self._construct_feature_matrix(chunk, rgb_to_hsv(chunk), substrate, rgb_to_hsv(substrate))
+            X_selected = self.rfe.transform(self.scaler.transform(X))
+            out[s:s + len(chunk)] = np.argmax(self.ensemble_proba(X_selected), axis=1)
+        return out
+
+    def predict_image(self, img, substrate_rgb, adaptive: bool = True,
+                      coarse_step: int = 16, tolerance: float = 4.0):
+        """
+        逐像素预测整幅图像的层数，返回 (层数图, 统计信息)。
+
+        adaptive 模式先在间隔 coarse_step 的网格上预测，只有四角预测不一致或块内颜色
+        标准差超过 tolerance（RGB 单位）的块才继续细分，直到逐像素预测；
+        其余块直接用角点的预测结果填充。模型调用次数随薄片边界长度而非图像面积增长。
+        """
+        img = np.ascontiguousarray(img, dtype=np.uint8)
+        h, w, _ = img.shape
+        if not adaptive:
+            idx = self._predict_pixels(img.reshape(-1, 3), substrate_rgb).reshape(h, w)
+            return self.label_encoder.classes_[idx], {"evaluations": h * w, "pixels": h * w, "saved": 0.0}
+
+        step = 1 << max(int(coarse_step) - 1, 0).bit_length()  # 取 2 的幂
+        H, W = -(-h // step) * step, -(-w // step) * step
+        padded = np.pad(img, ((0, H - h), (0, W - w), (0, 0)), mode='edge')
+        pred = np.full((h, w), -1, dtype=np.int64)  # 已预测像素的缓存，-1 表示尚未预测
+        evaluations = 0
+
+        def evaluate(ys, xs):
+            nonlocal evaluations
+            ys, xs = np.minimum(ys, h - 1), np.minimum(xs, w - 1)
+            todo = pred[ys, xs] < 0
+            if todo.any():
+                # 同一批中可能有重复的点，只预测一次
+                flat = np.unique(ys[todo] * w + xs[todo])
+                py, px = flat // w, flat % w
+                pred[py, px] = self._predict_pixels(img[py, px], substrate_rgb)
+                evaluations += len(flat)
+            return pred[ys, xs]
+
+        labels = np.full((H, W), -1, dtype=np.int64)
+        cy, cx = np.mgrid[0:H // step, 0:W // step]
+        cells_y, cells_x = cy.ravel() * step, cx.ravel() * step
+        while len(cells_y):
+            if step == 1:
+                labels[cells_y, cells_x] = evaluate(cells_y, cells_x)
+                break
+
+            # 四个角点（与相邻块共用）
+            y1, x1 = cells_y + step, cells_x + step
+            corners = np.stack([evaluate(cells_y, cells_x), evaluate(cells_y, x1),
+                                evaluate(y1, cells_x), evaluate(y1, x1)])
+            uniform = (corners == corners[0]).all(axis=0)
+
+            # 块内颜色标准差
+            blocks = padded.reshape(H // step, step, W // step, step, 3)
+            cand = np.flatnonzero(uniform)
+            if len(cand):
+                block = blocks[cells_y[cand] // step, :, cells_x[cand] // step].astype(np.float32)
+                spread = block.reshape(len(cand), -1, 3).std(axis=1).max(axis=1)
+                uniform[cand[spread > tolerance]] = False
+
+            label_blocks = labels.reshape(H // step, step, W // step, step)
+            label_blocks[cells_y[uniform] // step, :, cells_x[uniform] // step] = corners[0, uniform, None, None]
+
+            # 其余块四分后进入下一层（完全落在填充区域内的子块丢弃）
+            half = step // 2
+            split_y, split_x = cells_y[~uniform], cells_x[~uniform]
+            cells_y = np.concatenate([split_y, split_y, split_y + half, split_y + half])
+            cells_x = np.concatenate([split_x, split_x + half, split_x, split_x + half])
+            inside = (cells_y < h) & (cells_x < w)
+            cells_y, cells_x = cells_y[inside], cells_x[inside]
+            step = half
+
+        labels = labels[:h, :w]
+        report = {
+            "evaluations": evaluations,
+            "pixels": h * w,
+            "saved": 1.0 - evaluations / (h * w),
         }
-        return pd.DataFrame([features], columns=self.feature_names)
+        return self.label_encoder.classes_[labels], report
 
     def predict_all(self):
         if not self.prediction_data:
             return [], "没有点对可预测。"
 
-        rows = [self._construct_feature_row(*pair) for pair in self.prediction_data]
-        X = pd.concat(rows, ignore_index=True)
-        X_scaled = self.scaler.transform(X)
-        X_selected = self.rfe.transform(X_scaled)
-
-        y_pred = self.model.predict(X_selected)
-        labels = self.label_encoder.inverse_transform(y_pred)
+        rgb1, hsv1, rgb2, hsv2 = (np.array(col) for col in zip(*self.prediction_data))
+        X = self._construct_feature_matrix(rgb1, hsv1, rgb2, hsv2)
+        labels, proba = self._predict_features(X)
+        return list(labels), format_summary(labels, proba, self.label_encoder.classes_)
 
-        proba = self.model.predict_proba(X_selected)
-        mean_proba = proba.mean(axis=0)
-        soft_vote_index = np.argmax(mean_proba)
-        soft_vote_label = self.label_encoder.inverse_transform([soft_vote_index])[0]
-        soft_vote_prob = mean_proba[soft_vote_index]
 
-        count = Counter(labels)
-        majority_label, majority_votes = count.most_common(1)[0]
+def format_summary(labels, proba, classes):
+    mean_proba = proba.mean(axis=0)
+    soft_vote_index = np.argmax(mean_proba)
+    soft_vote_label = classes[soft_vote_index]
+    soft_vote_prob = mean_proba[soft_vote_index]
 
-        clean_labels = [int(l) for l in labels]
+    count = Counter(labels)
+    majority_label, majority_votes = count.most_common(1)[0]
 
-        summary = (
-            f"每组预测结果：{clean_labels}\n"
-            f"众数预测结果：{majority_label}（{majority_votes} 票）\n"
-            f"Soft Voting 预测：{soft_vote_label}（平均置信度：{soft_vote_prob:.2f}）"
-        )
+    clean_labels = [int(l) for l in labels]
 
-        return list(labels), summary
\ No newline at end of file
+    summary = (
+        f"每组预测结果：{clean_labels}\n"
+        f"众数预测结果：{majority_label}（{majority_votes} 票）\n"
+        f"Soft Voting 预测：{soft_vote_label}（平均置信度：{soft_vote_prob:.2f}）"
+    )
+    return summary
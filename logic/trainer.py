@@ -5,28 +5,51 @@ import pickle
 from sklearn.preprocessing import StandardScaler, LabelEncoder
 from sklearn.svm import SVC
 from sklearn.ensemble import RandomForestClassifier, VotingClassifier
-from sklearn.feature_selection import RFE
 from sklearn.model_selection import GridSearchCV
 from sklearn.metrics import classification_report, accuracy_score, confusion_matrix
 from sklearn.pipeline import Pipeline
 import logging
+from logic.annotation_store import FEATURE_COLUMNS, pair_features
+from logic.feature_selection import FeatureSelectionEngine
+from logic.distributed_search import DistributedSearchCV
+from logic.flat_forest import FlatForest
+from logic.model_selection import build_candidates, compare_models, select_within_budget, format_results
+
+# CSV 中的原始颜色列，其余 12 个特征由它们计算
+RAW_COLUMNS = ['R1', 'G1', 'B1', 'H1', 'S1', 'V1', 'R2', 'G2', 'B2', 'H2', 'S2', 'V2']
+RAW_DTYPES = {
+    'R1': np.uint8, 'G1': np.uint8, 'B1': np.uint8, 'R2': np.uint8, 'G2': np.uint8, 'B2': np.uint8,
+    'H1': np.float32, 'S1': np.float32, 'V1': np.float32, 'H2': np.float32, 'S2': np.float32, 'V2': np.float32,
+    'layer_count': np.int16,
+}
 
 class GrapheneTrainer:
     def __init__(self):
         self.df = None
+        self.sample_weight = None  # 每行代表的原始点对数
+        self.n_raw_rows = 0
         self.scaler = None
         self.rfe = None
         self.label_encoder = None
         self.model = None
         self.original_features = []
         self.selected_features = []
+        self.feature_engine = FeatureSelectionEngine()
+        self.search_backend = None  # DistributedBackend，为 None 时在本机调参
+        self.model_name = ""
+        self.model_results = []  # 各候选模型的准确率与延迟
         self.report_text = ""
 
-    def load_data(self, paths: list[str]):
+    def load_data(self, paths: list[str], quantization: int = 1):
+        """
+        读取 CSV 并构建紧凑的训练矩阵：RGB 为 uint8，其余特征为 float32，
+        相同的点对合并为一行，出现次数记入 sample_weight。
+        quantization > 1 时 RGB 按该步长量化后再合并（保留每组第一行的原始值）。
+        """
         dfs = []
         for path in paths:
             try:
-                df = pd.read_csv(path)
+                df = pd.read_csv(path, usecols=RAW_COLUMNS + ['layer_count'], dtype=RAW_DTYPES)
                 dfs.append(df)
             except Exception as e:
                 print(f"读取失败: {path}, 错误: {e}")
@@ -34,38 +57,44 @@ class GrapheneTrainer:
         if not dfs:
             return False
 
-        self.df = pd.concat(dfs, ignore_index=True)
-
-        # 构建 24 个特征
-        self.df['diff_R'] = (self.df['R1'] - self.df['R2']).abs()
-        self.df['diff_G'] = (self.df['G1'] - self.df['G2']).abs()
-        self.df['diff_B'] = (self.df['B1'] - self.df['B2']).abs()
-        self.df['diff_H'] = (self.df['H1'] - self.df['H2']).abs()
-        self.df['diff_S'] = (self.df['S1'] - self.df['S2']).abs()
-        self.df['diff_V'] = (self.df['V1'] - self.df['V2']).abs()
-
-        def safe_div(a, b):
-            return a / b.replace(0, np.nan)
-
-        self.df['ratio_R'] = safe_div(self.df['R1'], self.df['R2']).fillna(0)
-        self.df['ratio_G'] = safe_div(self.df['G1'], self.df['G2']).fillna(0)
-        self.df['ratio_B'] = safe_div(self.df['B1'], self.df['B2']).fillna(0)
-        self.df['ratio_H'] = safe_div(self.df['H1'], self.df['H2']).fillna(0)
-        self.df['ratio_S'] = safe_div(self.df['S1'], self.df['S2']).fillna(0)
-        self.df['ratio_V'] = safe_div(self.df['V1'], self.df['V2']).fillna(0)
-
-        self.original_features = [
-            'R1', 'G1', 'B1', 'H1', 'S1', 'V1',
-            'R2', 'G2', 'B2', 'H2', 'S2', 'V2',
-            'ratio_R', 'ratio_G', 'ratio_B', 'ratio_H', 'ratio_S', 'ratio_V',
-            'diff_R', 'diff_G', 'diff_B', 'diff_H', 'diff_S', 'diff_V'
-        ]
+        raw = pd.concat(dfs, ignore_index=True)
+        self.n_raw_rows = len(raw)
+        raw, self.sample_weight = self._deduplicate(raw, quantization)
+
+        # 构建 24 个特征（差值取绝对值），RGB 列保持 uint8
+        features = pair_features(
+            raw[['R1', 'G1', 'B1']].to_numpy(), raw[['H1', 'S1', 'V1']].to_numpy(),
+            raw[['R2', 'G2', 'B2']].to_numpy(), raw[['H2', 'S2', 'V2']].to_numpy(),
+            signed=False, dtype=np.float32,
+        )
+        self.original_features = list(FEATURE_COLUMNS)
+        self.df = pd.DataFrame(features, columns=self.original_features)
+        self.df = self.df.astype({c: np.uint8 for c in ['R1', 'G1', 'B1', 'R2', 'G2', 'B2']})
+        self.df['layer_count'] = raw['layer_count'].to_numpy()
 
         return True
 
-    def train(self):
+    @staticmethod
+    def _deduplicate(raw: pd.DataFrame, quantization: int):
+        if quantization > 1:
+            keys = raw[['R1', 'G1', 'B1', 'R2', 'G2', 'B2']] // quantization
+            keys['layer_count'] = raw['layer_count']
+        else:
+            keys = raw
+        # 按首次出现的顺序编号，每组保留第一行
+        codes = keys.groupby(list(keys.columns), sort=False, dropna=False).ngroup().to_numpy()
+        _, first = np.unique(codes, return_index=True)
+        counts = np.bincount(codes).astype(np.float32)
+        return raw.iloc[first].reset_index(drop=True), counts
+
+    def train(self, n_features: int = None, latency_budget_us: float = None):
+        """
+        latency_budget_us 为整图批量预测时每个样本允许的推理耗时（微秒），
+        为 None 时保留 SVM+RF 集成模型，否则保存预算内交叉验证准确率最高的模型。
+        """
         X = self.df[self.original_features]
         y_raw = self.df['layer_count']
+        w = self.sample_weight
 
         # 标签编码
         self.label_encoder = LabelEncoder()
@@ -73,12 +102,10 @@ class GrapheneTrainer:
 
         # 标准化
         self.scaler = StandardScaler()
-        X_scaled = self.scaler.fit_transform(X)
+        X_scaled = self.scaler.fit_transform(X, sample_weight=w)
 
-        # 特征选择
-        svc_linear = SVC(kernel='linear', C=1.0, random_state=42)
-        self.rfe = RFE(estimator=svc_linear, n_features_to_select=5)
-        self.rfe.fit(X_scaled, y)
+        # 特征选择：完整淘汰排名只算一次，再按交叉验证准确率选特征数
+        self.rfe = self.feature_engine.select(X_scaled, y, n_features, sample_weight=w)
         self.selected_features = np.array(self.original_features)[self.rfe.support_]
         X_selected = self.rfe.transform(X_scaled)
 
@@ -91,9 +118,8 @@ class GrapheneTrainer:
             'svm__C': [0.1, 1.0, 10.0],
             'svm__gamma': ['scale', 'auto']
         }
-        grid_svm = GridSearchCV(pipeline_svm, param_grid_svm,
-                                cv=5, scoring='accuracy', n_jobs=-1, refit=True)
-        grid_svm.fit(X_selected, y)
+        grid_svm = self._grid_search(pipeline_svm, param_grid_svm)
+        grid_svm.fit(X_selected, y, svm__sample_weight=w)
 
         # 随机森林调参
         pipeline_rf = Pipeline([
@@ -104,19 +130,15 @@ class GrapheneTrainer:
             'rf__max_depth': [None, 10],
             'rf__min_samples_split': [2, 4]
         }
-        grid_rf = GridSearchCV(pipeline_rf, param_grid_rf,
-                               cv=5, scoring='accuracy', n_jobs=-1, refit=True)
-        grid_rf.fit(X_selected, y)
-
-        # 集成模型
-        self.model = VotingClassifier(
-            estimators=[
-                ('svm', grid_svm.best_estimator_),
-                ('rf', grid_rf.best_estimator_)
-            ],
-            voting='soft'
-        )
-        self.model.fit(X_selected, y)
+        grid_rf = self._grid_search(pipeline_rf, param_grid_rf)
+        grid_rf.fit(X_selected, y, rf__sample_weight=w)
+
+        # 候选模型（集成模型取出 Pipeline 中的模型本身，以便传入 sample_weight）
+        candidates = build_candidates(grid_svm.best_estimator_[-1], grid_rf.best_estimator_[-1])
+        self.model_results = compare_models(candidates, X_selected, y, sample_weight=w)
+        chosen, within_budget = select_within_budget(self.model_results, latency_budget_us)
+        self.model = chosen["model"]
+        self.model_name = chosen["name"]
 
         # 评估
         y_pred = self.model.predict(X_selected)
@@ -128,21 +150,55 @@ class GrapheneTrainer:
         # 获取真实标签顺序（用于固定顺序显示）
         label_names = list(self.label_encoder.classes_)
 
-        acc = accuracy_score(y_true_labels, y_pred_labels)
-        report = classification_report(y_true_labels, y_pred_labels, labels=label_names)
-        cm = confusion_matrix(y_true_labels, y_pred_labels, labels=label_names)
+        # 按 sample_weight 加权，结果与未去重的数据一致
+        acc = accuracy_score(y_true_labels, y_pred_labels, sample_weight=w)
+        report = classification_report(y_true_labels, y_pred_labels, labels=label_names, sample_weight=w)
+        cm = confusion_matrix(y_true_labels, y_pred_labels, labels=label_names, sample_weight=w)
+        cm = cm.astype(int)
 
 
         self.report_text = (
         f"训练完成\n\n"
-        f"准确率：{acc * 100:.2f}%\n\n"
+        f"准确率：{acc * 100:.2f}%\n"
+        f"训练样本：{self.n_raw_rows} 组点对，去重后 {len(self.df)} 行\n\n"
         f"最佳 SVM 参数：{grid_svm.best_params_}\n"
         f"最佳随机森林参数：{grid_rf.best_params_}\n\n"
-        f"使用特征（RFE 选出）：{self.selected_features.tolist()}\n\n"
+        f"{self._format_model_choice(latency_budget_us, within_budget)}\n\n"
+        f"使用特征（RFE 选出）：{self.selected_features.tolist()}\n"
+        f"各特征数交叉验证准确率：{self._format_cv_scores()}\n\n"
         f"分类报告：\n{report}\n"
         f"混淆矩阵：\n{cm}"
         )
 
+    def _grid_search(self, pipeline, param_grid):
+        if self.search_backend is None:
+            return GridSearchCV(pipeline, param_grid,
+                                cv=5, scoring='accuracy', n_jobs=-1, refit=True)
+        return DistributedSearchCV(pipeline, param_grid, self.search_backend,
+                                   cv=5, scoring='accuracy', refit=True)
+
+    def _format_model_choice(self, latency_budget_us, within_budget):
+        if latency_budget_us is None:
+            budget = "未设置延迟预算，使用 SVM+RF 集成模型"
+        elif within_budget:
+            budget = f"延迟预算 {latency_budget_us:g} µs/样本，选用 {self.model_name}"
+        else:
+            budget = f"没有模型满足 {latency_budget_us:g} µs/样本的预算，选用最快的 {self.model_name}"
+        return f"{budget}\n{format_results(self.model_results, self.model_name)}"
+
+    def _format_cv_scores(self):
+        return ", ".join(
+            f"{k}:{mean * 100:.1f}%" + ("*" if k == self.feature_engine.n_features_ else "")
+            for k, mean, _ in self.feature_engine.cv_scores_
+        )
+
+    def get_feature_ranking(self):
+        return {
+            "features": list(self.original_features),
+            "ranking": self.feature_engine.ranking_.tolist(),
+            "cv_scores": list(self.feature_engine.cv_scores_),
+            "n_features": self.feature_engine.n_features_,
+        }
 
     def save_all(self, folder_path: str = "models"):
         os.makedirs(folder_path, exist_ok=True)
@@ -165,7 +221,22 @@ class GrapheneTrainer:
         with open(os.path.join(folder_path, "selected_features.pkl"), "wb") as f:
             pickle.dump(self.selected_features.tolist(), f)
 
+        with open(os.path.join(folder_path, "feature_ranking.pkl"), "wb") as f:
+            pickle.dump(self.get_feature_ranking(), f)
+
+        # 随机森林另存为扁平节点数组，预测时以内存映射方式加载
+        forest = self._find_forest()
+        if forest is not None:
+            FlatForest.from_sklearn(forest, quantize=True).save(os.path.join(folder_path, "forest"))
+
         return True
 
+    def _find_forest(self):
+        if isinstance(self.model, RandomForestClassifier):
+            return self.model
+        if isinstance(self.model, VotingClassifier):
+            return self.model.named_estimators_.get('rf')
+        return None
+
     def get_report(self):
         return self.report_text
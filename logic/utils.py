@@ -0,0 +1,9 @@
+import cv2
+import numpy as np
+
+
+def rgb_to_hsv(rgb):
+    """(n, 3) uint8 RGB → 归一化到 [0, 1] 的 HSV"""
+    rgb = np.asarray(rgb, dtype=np.uint8).reshape(-1, 1, 3)
+    hsv = cv2.cvtColor(rgb, cv2.COLOR_RGB2HSV).reshape(-1, 3)
+    return hsv.astype(float) / [179.0, 255.0, 255.0]
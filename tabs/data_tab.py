@@ -1,12 +1,15 @@
-import csv
 import os
+import numpy as np
 from PySide6.QtWidgets import (
     QWidget, QVBoxLayout, QPushButton, QHBoxLayout, QFileDialog,
-    QLabel, QGraphicsView, QGraphicsScene, QGraphicsPixmapItem, QInputDialog
+    QLabel, QGraphicsView, QGraphicsScene, QGraphicsPixmapItem, QInputDialog, QCheckBox, QApplication
 )
-from PySide6.QtGui import QPixmap, QImage, QWheelEvent, QMouseEvent, QPen, QColor, QPainter
-from PySide6.QtCore import Qt, QPointF, QEvent
+from PySide6.QtGui import QPixmap, QImage, QWheelEvent, QMouseEvent, QPainter, QPainterPath, QPen, QColor
+from PySide6.QtCore import Qt, QEvent
 from logic.data_collector import GrapheneDataCollectorCore
+from logic.annotation_store import SAMPLE, SUBSTRATE
+from logic.bulk_labeling import ColorClusterLabeler
+from tabs.overlay import PointOverlayItem, LayerMapItem, SELECTED_KIND
 from datetime import datetime
 
 class DataTab(QWidget):
@@ -23,11 +26,20 @@ class DataTab(QWidget):
 
         self.load_btn = QPushButton("打开图像")
         self.undo_btn = QPushButton("撤销上一个点")
+        self.delete_btn = QPushButton("删除选中")
+        self.relabel_btn = QPushButton("修改选中层数")
+        self.bulk_btn = QPushButton("颜色聚类标注")
+        self.bulk_btn.setCheckable(True)
+        self.chk_region = QCheckBox("仅连通区域")
         self.save_btn = QPushButton("保存数据为 CSV")
         self.status_label = QLabel("准备就绪")
 
         self.button_bar.addWidget(self.load_btn)
         self.button_bar.addWidget(self.undo_btn)
+        self.button_bar.addWidget(self.delete_btn)
+        self.button_bar.addWidget(self.relabel_btn)
+        self.button_bar.addWidget(self.bulk_btn)
+        self.button_bar.addWidget(self.chk_region)
         self.button_bar.addWidget(self.save_btn)
         self.button_bar.addWidget(self.status_label)
 
@@ -40,16 +52,25 @@ class DataTab(QWidget):
         self.scene = QGraphicsScene(self)
         self.view.setScene(self.scene)
         self.pixmap_item = None
+        self.overlay = None
+        self.cluster_item = None  # 聚类标注模式下显示的聚类图
+        self.labeler = ColorClusterLabeler()
+        self.lasso_item = None
+        self.lasso_points = None  # Ctrl + 左键拖动时的套索顶点
+        self.selected_pairs = np.empty(0, dtype=np.int64)
 
         self.scale = 1.0
-        self.point_items = []
 
         # 信号绑定
         self.load_btn.clicked.connect(self.load_image)
         self.undo_btn.clicked.connect(self.undo_point)
+        self.delete_btn.clicked.connect(self.delete_selected)
+        self.relabel_btn.clicked.connect(self.relabel_selected)
+        self.bulk_btn.toggled.connect(self.toggle_bulk_mode)
         self.save_btn.clicked.connect(self.save_data)
 
         self.view.viewport().installEventFilter(self)
+        self.view.viewport().setMouseTracking(True)  # 悬停提示
         self.drag_start = None  # 拖动起点
 
         self.point_index = 0 
@@ -73,7 +94,12 @@ class DataTab(QWidget):
             return
 
         self.scene.clear()
-        self.point_items.clear()
+        self.cluster_item = None
+        self.labeler.labels = None
+        self.bulk_btn.setChecked(False)
+        self.lasso_item = None
+        self.lasso_points = None
+        self.selected_pairs = np.empty(0, dtype=np.int64)
 
         img = self.core.get_image()
         h, w, _ = img.shape
@@ -82,7 +108,13 @@ class DataTab(QWidget):
 
         self.pixmap_item = QGraphicsPixmapItem(pixmap)
         self.scene.addItem(self.pixmap_item)
-        self.set_status("图像加载成功，点击图像采样。")
+        self.cluster_item = LayerMapItem(w, h)
+        self.cluster_item.setVisible(False)
+        self.scene.addItem(self.cluster_item)
+        # 所有选点由同一个图元绘制
+        self.overlay = PointOverlayItem(w, h)
+        self.scene.addItem(self.overlay)
+        self.set_status("图像加载成功，点击图像采样（Shift+点击删除，Ctrl+拖动套索选择）。")
         # 计算缩放因子，让图像适应视图大小
         view_size = self.view.viewport().size()
         scale_x = view_size.width() / self.pixmap_item.pixmap().width()
@@ -96,21 +128,104 @@ class DataTab(QWidget):
         self.view.centerOn(self.pixmap_item)
 
     def undo_point(self):
-        if not self.point_items:
+        if self.bulk_btn.isChecked():
+            self.core.undo_bulk_rows()
+            self.set_status(f"已撤销上一次批量标注，共 {self.core.row_count()} 行。")
+            return
+        if not len(self.core.get_points()):
             return
         self.core.undo_last_point()
-        # 删除最后两个图形元素（点和编号）
-        for _ in range(2):
-            item = self.point_items.pop()
-            self.scene.removeItem(item)
+        if self.prune_selection():
+            # 撤销的是选中点对的衬底点：剩下的样本点不再高亮
+            self.refresh_overlay()
+        else:
+            self.overlay.pop()
         self.set_status("撤销上一个点。")
 
-    from PySide6.QtWidgets import QFileDialog
+    def prune_selection(self) -> bool:
+        """从选择中去掉已不存在的点对，返回选择是否有变化"""
+        alive = np.isin(self.selected_pairs, self.core.get_points().pairs())
+        self.selected_pairs = self.selected_pairs[alive]
+        return not alive.all()
+
+    def refresh_overlay(self):
+        """删除或选择变化后整体刷新标记，选中点对的点用高亮色"""
+        store = self.core.get_points()
+        idx = store.points()
+        kinds = store.kinds(idx).copy()
+        if len(self.selected_pairs):
+            kinds[np.isin(store.pair_ids(idx), self.selected_pairs)] = SELECTED_KIND
+        self.overlay.set_points(store.coordinates(idx), kinds)
+
+    def delete_selected(self):
+        if not len(self.selected_pairs):
+            self.set_status("没有选中的点对。")
+            return
+        store = self.core.get_points()
+        n = len(self.selected_pairs)
+        for p in self.selected_pairs:
+            store.delete_pair(int(p))
+        self.selected_pairs = np.empty(0, dtype=np.int64)
+        self.refresh_overlay()
+        self.set_status(f"已删除 {n} 组点对，剩余 {store.pair_count()} 组。")
+
+    def relabel_selected(self):
+        if not len(self.selected_pairs):
+            self.set_status("没有选中的点对。")
+            return
+        count, ok = QInputDialog.getInt(self, "修改层数", f"将选中的 {len(self.selected_pairs)} 组点对改为层数：")
+        if not ok:
+            return
+        self.core.set_layer_count(self.selected_pairs, count)
+        self.set_status(f"已将 {len(self.selected_pairs)} 组点对的层数改为 {count}。")
+
+    def toggle_bulk_mode(self, checked: bool):
+        if self.cluster_item is None:
+            if checked:
+                self.bulk_btn.setChecked(False)
+                self.set_status("请先打开图像。")
+            return
+        if checked and self.labeler.labels is None:
+            self.set_status("正在对图像颜色聚类...")
+            QApplication.processEvents()
+            self.labeler.fit(self.core.get_image())
+            self.show_clusters()
+        self.cluster_item.setVisible(checked)
+        if checked:
+            self.set_status("点击区域并输入层数批量生成数据；Shift+点击指定衬底。")
+
+    def show_clusters(self):
+        # 衬底聚类不着色
+        labels = self.labeler.labels.astype(np.int16)
+        labels[labels == self.labeler.substrate_cluster] = -1
+        self.cluster_item.set_map(labels)
+
+    def handle_bulk_click(self, event: QMouseEvent):
+        pos = self.view.mapToScene(event.pos())
+        x, y = int(pos.x()), int(pos.y())
+        h, w = self.labeler.labels.shape
+        if not (0 <= x < w and 0 <= y < h):
+            return True
+        if event.modifiers() & Qt.ShiftModifier:
+            self.labeler.set_substrate(x, y)
+            self.show_clusters()
+            self.set_status(f"衬底颜色：{self.labeler.substrate_rgb.tolist()}")
+            return True
+        if self.labeler.cluster_at(x, y) == self.labeler.substrate_cluster:
+            self.set_status("所选区域为衬底，请点击样本区域。")
+            return True
 
+        count, ok = QInputDialog.getInt(self, "批量标注", "该区域的石墨烯层数：",
+                                        self.core.layer_count or 0)
+        if not ok:
+            return True
+        rows = self.labeler.training_rows(x, y, count, connected=self.chk_region.isChecked())
+        self.core.add_bulk_rows(rows)
+        self.set_status(f"已添加 {len(rows)} 行（{count} 层），共 {self.core.row_count()} 行。")
+        return True
 
     def save_data(self):
-        data = self.core.get_data()
-        if not data:
+        if self.core.row_count() == 0:
             self.set_status("当前没有记录任何数据，无法保存。")
             return
 
@@ -126,19 +241,8 @@ class DataTab(QWidget):
             self.set_status("用户取消保存")
             return
 
-        field_order = [
-            "R1", "G1", "B1", "H1", "S1", "V1",
-            "R2", "G2", "B2", "H2", "S2", "V2",
-            "ratio_R", "ratio_G", "ratio_B", "ratio_H", "ratio_S", "ratio_V",
-            "diff_R", "diff_G", "diff_B", "diff_H", "diff_S", "diff_V",
-            "layer_count"
-        ]
-
         try:
-            with open(save_path, "w", newline='') as f:
-                writer = csv.DictWriter(f, fieldnames=field_order)
-                writer.writeheader()
-                writer.writerows(data)
+            self.core.export_to_csv(save_path)
             self.set_status(f"数据已保存到：{os.path.basename(save_path)}")
         except Exception as e:
             self.set_status(f"保存失败：{e}")
@@ -147,27 +251,100 @@ class DataTab(QWidget):
         if source is self.view.viewport():
             if event.type() == QEvent.MouseButtonPress:
                 if event.button() == Qt.LeftButton:
+                    if self.bulk_btn.isChecked():
+                        return self.handle_bulk_click(event)
+                    if event.modifiers() & Qt.ControlModifier:
+                        return self.start_lasso(event)
+                    if event.modifiers() & Qt.ShiftModifier:
+                        return self.handle_delete(event)
                     return self.handle_click(event)
                 elif event.button() == Qt.RightButton:
                     self.drag_start = event.pos()
                     return True
 
             elif event.type() == QEvent.MouseMove:
+                if self.lasso_points is not None:
+                    return self.extend_lasso(event)
                 if self.drag_start:
                     delta = event.pos() - self.drag_start
                     self.drag_start = event.pos()
                     self.view.horizontalScrollBar().setValue(self.view.horizontalScrollBar().value() - delta.x())
                     self.view.verticalScrollBar().setValue(self.view.verticalScrollBar().value() - delta.y())
                     return True
+                return self.handle_hover(event)
 
             elif event.type() == QEvent.MouseButtonRelease:
                 self.drag_start = None
+                if self.lasso_points is not None:
+                    return self.finish_lasso()
                 return True
 
             elif event.type() == QEvent.Wheel:
                 return self.handle_zoom(event)
         return super().eventFilter(source, event)
 
+    def _hit_radius(self):
+        # 标记在屏幕上的半径换算到图像坐标
+        return 8.0 / max(self.view.transform().m11(), 1e-6)
+
+    def handle_hover(self, event: QMouseEvent):
+        if self.overlay is None:
+            return False
+        pos = self.view.mapToScene(event.pos())
+        store = self.core.get_points()
+        i = store.hit_test(pos.x(), pos.y(), self._hit_radius())
+        if i < 0:
+            return False
+        kind = "样本点" if store.kind(i) == SAMPLE else "衬底点"
+        p = store.pair_of(i)
+        if p < 0:
+            self.set_status(f"{kind}（未成对）")
+        else:
+            self.set_status(f"{kind}，层数 {store.layer_count(p)}")
+        return False
+
+    def handle_delete(self, event: QMouseEvent):
+        if self.overlay is None:
+            return True
+        pos = self.view.mapToScene(event.pos())
+        if not self.core.delete_at(pos.x(), pos.y(), self._hit_radius()):
+            self.set_status("该位置没有标记点。")
+            return True
+        store = self.core.get_points()
+        self.prune_selection()
+        self.refresh_overlay()
+        self.set_status(f"已删除，剩余 {store.pair_count()} 组数据。")
+        return True
+
+    def start_lasso(self, event: QMouseEvent):
+        if self.overlay is None:
+            return True
+        pos = self.view.mapToScene(event.pos())
+        self.lasso_points = [(pos.x(), pos.y())]
+        pen = QPen(QColor("yellow"))
+        pen.setCosmetic(True)
+        pen.setStyle(Qt.DashLine)
+        self.lasso_item = self.scene.addPath(QPainterPath(pos), pen)
+        self.lasso_item.setZValue(3)
+        return True
+
+    def extend_lasso(self, event: QMouseEvent):
+        pos = self.view.mapToScene(event.pos())
+        self.lasso_points.append((pos.x(), pos.y()))
+        path = self.lasso_item.path()
+        path.lineTo(pos)
+        self.lasso_item.setPath(path)
+        return True
+
+    def finish_lasso(self):
+        store = self.core.get_points()
+        self.selected_pairs = store.pairs_of(store.select_lasso(self.lasso_points))
+        self.scene.removeItem(self.lasso_item)
+        self.lasso_item = None
+        self.lasso_points = None
+        self.refresh_overlay()
+        self.set_status(f"已选中 {len(self.selected_pairs)} 组点对。")
+        return True
 
     def handle_click(self, event: QMouseEvent):
         scene_pos = self.view.mapToScene(event.pos())
@@ -178,20 +355,13 @@ class DataTab(QWidget):
             self.set_status("点击无效。")
             return True
 
-        color = "red" if len(self.core.get_points()) % 2 == 1 else "blue"
-        pen = QPen(QColor(color))
-        pen.setWidth(8)  # 更粗的边框
-        dot = self.scene.addEllipse(x - 4, y - 4, 8, 8, pen)  # 更大的点
-        self.point_items.append(dot)
-
-        label = self.scene.addText(str(len(self.core.get_points())))
-        label.setPos(QPointF(x + 8, y))
-        label.setDefaultTextColor(QColor("white"))
-        label.setScale(1.5)  # 放大文字
-        self.point_items.append(label)
+        # 样本点（红）之后的一个点为衬底点（蓝）
+        store = self.core.get_points()
+        kind = SAMPLE if store.has_pending() else SUBSTRATE
+        self.overlay.append(x, y, kind)
 
-        if len(self.core.get_points()) % 2 == 0:
-            self.set_status(f"已记录第 {len(self.core.get_data())} 组数据。")
+        if kind == SUBSTRATE:
+            self.set_status(f"已记录第 {store.pair_count()} 组数据。")
         return True
 
 
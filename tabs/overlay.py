@@ -0,0 +1,209 @@
+import numpy as np
+from PySide6.QtWidgets import QGraphicsItem, QStyleOptionGraphicsItem
+from PySide6.QtGui import QPen, QColor, QImage, QFont, QPolygonF
+from PySide6.QtCore import Qt, QRectF, QPointF
+
+# 标记颜色：0 = 样本点（红），1 = 衬底点（蓝），2 = 选中（黄）
+POINT_COLORS = [QColor("red"), QColor("blue"), QColor("yellow")]
+SELECTED_KIND = 2
+POINT_DIAMETER = 16
+# 可见点数超过该值或缩放过小时不再绘制编号
+MAX_LABELS = 500
+MIN_LABEL_LOD = 0.3
+# 缩小显示且可见点数超过该值时，网格内（四分之一个标记或一个屏幕像素）的同色点只绘制一个
+THIN_MIN_POINTS = 2000
+
+
+class PointOverlayItem(QGraphicsItem):
+    """用一个图元绘制全部选点标记，坐标保存在 NumPy 数组中"""
+
+    def __init__(self, width: int, height: int, parent=None):
+        super().__init__(parent)
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption, True)
+        self.setZValue(2)
+        pad = POINT_DIAMETER + 40
+        self._bounds = QRectF(-pad, -pad, width + 2 * pad, height + 2 * pad)
+        self._xy = np.empty((0, 2), dtype=np.float32)
+        self._kind = np.empty(0, dtype=np.uint8)
+        self._size = 0
+        # 每种颜色全部点的 QPolygonF 与每个点的 QPointF，随增删增量维护，重绘时不再逐点构造
+        self._polys = [QPolygonF() for _ in POINT_COLORS]
+        self._qpoints = []
+        self._font = QFont()
+        self._font.setPointSizeF(self._font.pointSizeF() * 1.5)
+
+    def boundingRect(self):
+        return self._bounds
+
+    def count(self):
+        return self._size
+
+    def coordinates(self):
+        return self._xy[:self._size]
+
+    def kinds(self):
+        return self._kind[:self._size]
+
+    def _reserve(self, n: int):
+        if n <= len(self._xy):
+            return
+        cap = max(n, 2 * len(self._xy), 64)
+        xy = np.empty((cap, 2), dtype=np.float32)
+        kind = np.empty(cap, dtype=np.uint8)
+        xy[:self._size] = self._xy[:self._size]
+        kind[:self._size] = self._kind[:self._size]
+        self._xy, self._kind = xy, kind
+
+    def _dirty_rect(self, xy: np.ndarray):
+        if len(xy) == 0:
+            return QRectF()
+        pad = POINT_DIAMETER
+        x0, y0 = xy.min(axis=0)
+        x1, y1 = xy.max(axis=0)
+        # 右侧留出编号文字的空间
+        return QRectF(x0 - pad, y0 - pad, x1 - x0 + 2 * pad + 80, y1 - y0 + 2 * pad + 40)
+
+    def set_points(self, xy, kind):
+        xy = np.asarray(xy, dtype=np.float32).reshape(-1, 2)
+        self._xy = xy.copy()
+        self._kind = np.asarray(kind, dtype=np.uint8).copy()
+        self._size = len(xy)
+        self._qpoints = [QPointF(x, y) for x, y in xy.tolist()]
+        self._polys = [QPolygonF([self._qpoints[i] for i in np.flatnonzero(self._kind == k)])
+                       for k in range(len(POINT_COLORS))]
+        self.update()
+
+    def append(self, x: float, y: float, kind: int):
+        self._reserve(self._size + 1)
+        self._xy[self._size] = (x, y)
+        self._kind[self._size] = kind
+        self._size += 1
+        point = QPointF(x, y)
+        self._qpoints.append(point)
+        self._polys[kind].append(point)
+        self.update(self._dirty_rect(self._xy[self._size - 1:self._size]))
+
+    def pop(self, n: int = 1):
+        n = min(n, self._size)
+        if n <= 0:
+            return
+        dirty = self._dirty_rect(self._xy[self._size - n:self._size])
+        # 末尾的点也是各自颜色多边形的末尾
+        for k in self._kind[self._size - n:self._size].tolist():
+            self._polys[k].removeLast()
+        del self._qpoints[self._size - n:]
+        self._size -= n
+        self.update(dirty)
+
+    def clear(self):
+        self._size = 0
+        self._polys = [QPolygonF() for _ in POINT_COLORS]
+        self._qpoints = []
+        self.update()
+
+    @staticmethod
+    def _thin(idx: np.ndarray, xy: np.ndarray, cell: float):
+        """每个 cell × cell 网格只保留第一个点"""
+        keys = np.floor(xy[idx] / cell).astype(np.int64)
+        keys = (keys[:, 0] << 32) + keys[:, 1]
+        _, first = np.unique(keys, return_index=True)
+        return idx[np.sort(first)]
+
+    def paint(self, painter, option: QStyleOptionGraphicsItem, widget=None):
+        if self._size == 0:
+            return
+        exposed = option.exposedRect
+        pad = POINT_DIAMETER
+        xy = self._xy[:self._size]
+        # 只绘制视口内的点
+        visible = (
+            (xy[:, 0] >= exposed.left() - pad) & (xy[:, 0] <= exposed.right() + pad) &
+            (xy[:, 1] >= exposed.top() - pad) & (xy[:, 1] <= exposed.bottom() + pad)
+        )
+        idx = np.flatnonzero(visible)
+        if len(idx) == 0:
+            return
+
+        lod = QStyleOptionGraphicsItem.levelOfDetailFromTransform(painter.worldTransform())
+        thin = len(idx) > THIN_MIN_POINTS and lod < 1.0
+        kind = self._kind[idx]
+        for k, color in enumerate(POINT_COLORS):
+            if not thin and len(idx) == self._size:
+                poly = self._polys[k]
+            else:
+                sel = idx[kind == k]
+                if thin and len(sel):
+                    # 几乎重合的同色标记看起来与一个相同，只画其中一个
+                    sel = self._thin(sel, xy, max(0.25 * POINT_DIAMETER, 1.0 / lod))
+                poly = QPolygonF([self._qpoints[i] for i in sel.tolist()])
+            if poly.isEmpty():
+                continue
+            pen = QPen(color)
+            pen.setWidthF(POINT_DIAMETER)
+            pen.setCapStyle(Qt.RoundCap)
+            painter.setPen(pen)
+            painter.drawPoints(poly)
+
+        if len(idx) > MAX_LABELS or lod < MIN_LABEL_LOD:
+            return
+        painter.setPen(QColor("white"))
+        painter.setFont(self._font)
+        for i in idx:
+            x, y = xy[i]
+            painter.drawText(QPointF(x + 12, y + 8), str(i + 1))
+
+
+class LayerMapItem(QGraphicsItem):
+    """半透明层数图，整幅图用一张纹理绘制，按脏区域局部更新"""
+
+    def __init__(self, width: int, height: int, alpha: int = 110, parent=None):
+        super().__init__(parent)
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption, True)
+        self.setZValue(1)
+        self._width = width
+        self._height = height
+        self._rgba = np.zeros((height, width, 4), dtype=np.uint8)
+        self._image = QImage(self._rgba.data, width, height, width * 4, QImage.Format_RGBA8888)
+        self._lut = self._build_lut(alpha)
+
+    @staticmethod
+    def _build_lut(alpha: int, n_labels: int = 16):
+        # 第 0 项对应 -1（未预测），完全透明
+        lut = np.zeros((n_labels + 1, 4), dtype=np.uint8)
+        for i in range(n_labels):
+            color = QColor.fromHsv((i * 47) % 360, 220, 255)
+            lut[i + 1] = (color.red(), color.green(), color.blue(), alpha)
+        return lut
+
+    def boundingRect(self):
+        return QRectF(0, 0, self._width, self._height)
+
+    def label_color(self, label: int) -> QColor:
+        r, g, b, a = self._lut[self._lut_index(np.asarray(label))]
+        return QColor(int(r), int(g), int(b), int(a))
+
+    def _lut_index(self, labels: np.ndarray):
+        return np.clip(labels.astype(np.int64), -1, len(self._lut) - 2) + 1
+
+    def set_map(self, labels: np.ndarray):
+        """整幅更新，labels 为 (h, w) 整数数组，-1 表示无预测"""
+        self.update_region(0, 0, labels)
+
+    def update_region(self, x: int, y: int, labels: np.ndarray):
+        """只更新 (x, y) 起的子区域"""
+        h, w = labels.shape
+        x1, y1 = min(x + w, self._width), min(y + h, self._height)
+        if x1 <= x or y1 <= y:
+            return
+        self._rgba[y:y1, x:x1] = self._lut[self._lut_index(labels[:y1 - y, :x1 - x])]
+        self.update(QRectF(x, y, x1 - x, y1 - y))
+
+    def clear(self):
+        self._rgba[...] = 0
+        self.update()
+
+    def paint(self, painter, option: QStyleOptionGraphicsItem, widget=None):
+        exposed = option.exposedRect.intersected(self.boundingRect())
+        if exposed.isEmpty():
+            return
+        painter.drawImage(exposed, self._image, exposed)
@@ -1,24 +1,33 @@
 from PySide6.QtWidgets import (
     QWidget, QVBoxLayout, QPushButton, QHBoxLayout, QFileDialog,
-    QLabel, QGraphicsView, QGraphicsScene, QGraphicsPixmapItem, QTextEdit, QComboBox
+    QLabel, QGraphicsView, QGraphicsScene, QGraphicsPixmapItem, QTextEdit, QComboBox, QCheckBox, QApplication
 )
-from PySide6.QtGui import QPixmap, QImage, QMouseEvent, QPen, QColor
-from PySide6.QtCore import Qt, QPointF, QEvent
+from PySide6.QtGui import QPixmap, QImage, QMouseEvent
+from PySide6.QtCore import Qt, QEvent
 import numpy as np
 import cv2
 import os
 
-from logic.predictor import GraphenePredictor
+from logic.predictor import GraphenePredictor, format_summary
+from logic.prediction_service import PredictionClient
+from logic.distributed_search import parse_address
+from logic.annotation_store import AnnotationStore, SUBSTRATE
+from tabs.overlay import PointOverlayItem, LayerMapItem
+
+# 本地预测服务地址与密钥，可通过环境变量修改（密钥与服务启动时指定或打印的相同）
+PREDICT_SERVICE_ADDRESS = os.environ.get("GRAPHENE_PREDICT_ADDRESS", "127.0.0.1:6200")
+PREDICT_SERVICE_AUTHKEY = os.environ.get("GRAPHENE_PREDICT_AUTHKEY")
 
 class PredictTab(QWidget):
     def __init__(self):
         super().__init__()
         self.predictor = GraphenePredictor()
         self.cv_img = None
-        self.point_buffer = []
-        self.point_items = []
-        self.point_index = 0
+        self.store = AnnotationStore()  # 选点与点对
+        self.overlay = None
+        self.layer_map_item = None
         self.drag_start = None
+        self.service_client = None
 
         self.layout = QVBoxLayout(self)
 
@@ -31,6 +40,8 @@ class PredictTab(QWidget):
         self.btn_predict = QPushButton("重新预测")
         self.btn_clear = QPushButton("清除所有点")
         self.btn_undo = QPushButton("撤销上一个点")
+        self.btn_layer_map = QPushButton("生成层数图")
+        self.chk_service = QCheckBox("使用预测服务")
         self.status = QLabel("状态：")
 
         control_bar.addWidget(self.btn_refresh_models)
@@ -41,6 +52,8 @@ class PredictTab(QWidget):
         control_bar.addWidget(self.btn_undo)
         control_bar.addWidget(self.btn_clear)
         control_bar.addWidget(self.btn_predict)
+        control_bar.addWidget(self.btn_layer_map)
+        control_bar.addWidget(self.chk_service)
         control_bar.addWidget(self.status)
         self.layout.addLayout(control_bar)
 
@@ -69,6 +82,7 @@ class PredictTab(QWidget):
         self.btn_clear.clicked.connect(self.clear_all)
         self.btn_undo.clicked.connect(self.undo_point)
         self.btn_predict.clicked.connect(self.run_prediction)
+        self.btn_layer_map.clicked.connect(self.generate_layer_map)
         self.btn_refresh_models.clicked.connect(self.refresh_model_list)
 
         self.refresh_model_list()
@@ -105,6 +119,11 @@ class PredictTab(QWidget):
 
         self.pixmap_item = QGraphicsPixmapItem(pixmap)
         self.scene.addItem(self.pixmap_item)
+        # 层数图与选点各用一个图元绘制
+        self.layer_map_item = LayerMapItem(w, h)
+        self.scene.addItem(self.layer_map_item)
+        self.overlay = PointOverlayItem(w, h)
+        self.scene.addItem(self.overlay)
 
         scale_x = self.view.viewport().width() / w
         scale_y = self.view.viewport().height() / h
@@ -119,6 +138,8 @@ class PredictTab(QWidget):
         if source is self.view.viewport():
             if event.type() == QEvent.MouseButtonPress:
                 if event.button() == Qt.LeftButton:
+                    if event.modifiers() & Qt.ShiftModifier:
+                        return self.handle_delete(event)
                     return self.handle_click(event)
                 elif event.button() == Qt.RightButton:
                     self.drag_start = event.pos()
@@ -150,53 +171,104 @@ class PredictTab(QWidget):
         hsv = cv2.cvtColor(np.uint8([[rgb]]), cv2.COLOR_RGB2HSV)[0][0]
         h_norm, s_norm, v_norm = hsv.astype(float) / [179.0, 255.0, 255.0]
 
-        self.point_buffer.append((rgb, (h_norm, s_norm, v_norm)))
-        self.point_index += 1
-        pen = QPen(QColor("red") if self.point_index % 2 == 1 else QColor("blue"))
-        pen.setWidth(8)
-        dot = self.scene.addEllipse(x - 4, y - 4, 8, 8, pen)
-        label = self.scene.addText(str(self.point_index))
-        label.setPos(x + 8, y)
-        label.setDefaultTextColor(QColor("white"))
-        label.setScale(1.3)
-
-        self.point_items += [dot, label]
-
-        if len(self.point_buffer) == 2:
-            (rgb1, hsv1), (rgb2, hsv2) = self.point_buffer
-            self.predictor.add_point_pair(rgb1, hsv1, rgb2, hsv2)
-            self.point_buffer = []
+        i = self.store.add_point(x, y, rgb, (h_norm, s_norm, v_norm))
+        self.overlay.append(x, y, self.store.kind(i))
+
+        if self.store.kind(i) == SUBSTRATE:
+            rgb1, hsv1, rgb2, hsv2 = self.store.pair_colors([self.store.pair_of(i)])
+            self.predictor.add_point_pair(rgb1[0], hsv1[0], rgb2[0], hsv2[0])
+        return True
+
+    def handle_delete(self, event: QMouseEvent):
+        """Shift + 点击删除附近的点（已成对的连同点对一起删除）"""
+        if self.overlay is None: return True
+        pos = self.view.mapToScene(event.pos())
+        radius = 8.0 / max(self.view.transform().m11(), 1e-6)
+        i = self.store.hit_test(pos.x(), pos.y(), radius)
+        if i < 0: return True
+        paired = self.store.pair_of(i) >= 0
+        self.store.delete_point(i)
+        self.overlay.set_points(self.store.coordinates(), self.store.kinds())
+        if paired:
+            self.sync_pairs()
+            self.run_prediction()
+        self.set_status("已删除所选点")
         return True
 
+    def sync_pairs(self):
+        self.predictor.prediction_data = list(zip(*self.store.pair_colors()))
+
     def run_prediction(self):
-        labels, summary = self.predictor.predict_all()
+        if self.chk_service.isChecked() and self.predictor.prediction_data:
+            try:
+                labels, summary = self.predict_with_service()
+            except Exception as e:
+                self.service_client = None
+                self.set_status(f"预测服务不可用，改用本地模型：{e}")
+                labels, summary = self.predictor.predict_all()
+        else:
+            labels, summary = self.predictor.predict_all()
         self.result_text.setText(summary)
         lines = summary.splitlines()
         self.result_summary.setText(lines[2] if len(lines) > 2 else "预测失败")
 
+    def predict_with_service(self):
+        if self.service_client is None:
+            if not PREDICT_SERVICE_AUTHKEY:
+                raise RuntimeError("未设置 GRAPHENE_PREDICT_AUTHKEY")
+            self.service_client = PredictionClient(
+                parse_address(PREDICT_SERVICE_ADDRESS), PREDICT_SERVICE_AUTHKEY.encode()
+            )
+        model = self.model_selector.currentText()
+        rgb1 = np.array([pair[0] for pair in self.predictor.prediction_data])
+        rgb2 = np.array([pair[2] for pair in self.predictor.prediction_data])
+        labels, proba = self.service_client.predict(model, rgb1, rgb2)
+        classes = self.service_client.classes(model)
+        return list(labels), format_summary(labels, proba, classes)
+
+    def generate_layer_map(self):
+        """以最后一组点对的衬底颜色为参照，自适应地预测整幅图像"""
+        if self.cv_img is None or self.predictor.model is None:
+            self.set_status("请先加载图像和模型")
+            return
+        if not self.predictor.prediction_data:
+            self.set_status("请先选取一组点对（第二个点为衬底）")
+            return
+        substrate_rgb = self.predictor.prediction_data[-1][2]
+        self.set_status("正在生成层数图...")
+        QApplication.processEvents()
+        labels, report = self.predictor.predict_image(self.cv_img, substrate_rgb)
+        self.show_layer_map(labels)
+        self.set_status(
+            f"层数图已生成：模型调用 {report['evaluations']} 次，"
+            f"节省 {report['saved'] * 100:.1f}%"
+        )
+
+    def show_layer_map(self, labels, x: int = 0, y: int = 0):
+        """在图像上叠加层数图，labels 为整数数组，-1 表示无预测"""
+        if self.layer_map_item is None:
+            return
+        self.layer_map_item.update_region(x, y, labels)
+
     def clear_all(self):
-        self.point_buffer.clear()
+        self.store.clear()
         self.predictor.reset()
         self.result_text.clear()
         self.result_summary.setText("暂无预测")
-        for item in self.point_items:
-            self.scene.removeItem(item)
-        self.point_items.clear()
-        self.point_index = 0
+        if self.overlay is not None:
+            self.overlay.clear()
+        if self.layer_map_item is not None:
+            self.layer_map_item.clear()
         self.set_status("已清除所有点")
 
     def undo_point(self):
-        if self.point_buffer:
-            self.point_buffer.pop()
-            for _ in range(2):
-                if self.point_items:
-                    self.scene.removeItem(self.point_items.pop())
-            self.point_index -= 1
-        elif self.predictor.prediction_data:
+        if self.store.has_pending():
+            self.store.remove_last_point()
+            self.overlay.pop(1)
+        elif self.store.pair_count():
+            self.store.remove_last_point()
+            self.store.remove_last_point()
             self.predictor.prediction_data.pop()
-            for _ in range(4):
-                if self.point_items:
-                    self.scene.removeItem(self.point_items.pop())
-            self.point_index -= 2
+            self.overlay.pop(2)
             self.run_prediction()
-        self.set_status("已撤销上一个点或点对")
\ No newline at end of file
+        self.set_status("已撤销上一个点或点对")
@@ -1,10 +1,17 @@
 from PySide6.QtWidgets import (
     QWidget, QVBoxLayout, QPushButton, QTextEdit,
-    QFileDialog, QLabel, QInputDialog
+    QFileDialog, QLabel, QInputDialog, QCheckBox, QApplication,
+    QHBoxLayout, QDoubleSpinBox
 )
 import os
 from glob import glob
 from logic.trainer import GrapheneTrainer
+from logic.distributed_search import DistributedBackend, parse_address
+
+# 分布式调参监听地址与密钥，可通过环境变量修改以便其他主机的工作进程接入；
+# 未设置密钥时只能监听本机地址，使用随机密钥
+SEARCH_ADDRESS = os.environ.get("GRAPHENE_SEARCH_ADDRESS", "127.0.0.1:0")
+SEARCH_AUTHKEY = os.environ.get("GRAPHENE_SEARCH_AUTHKEY")
 
 class TrainTab(QWidget):
     def __init__(self):
@@ -25,6 +32,19 @@ class TrainTab(QWidget):
         self.layout.addWidget(self.btn_load_select)
 
         # 训练 & 保存模型按钮
+        self.chk_distributed = QCheckBox("分布式调参（工作进程池）")
+        self.layout.addWidget(self.chk_distributed)
+
+        # 推理延迟预算：0 表示不限制，使用 SVM+RF 集成模型
+        budget_row = QHBoxLayout()
+        budget_row.addWidget(QLabel("延迟预算（µs/样本，0 为不限）："))
+        self.spin_budget = QDoubleSpinBox()
+        self.spin_budget.setRange(0, 100000)
+        self.spin_budget.setDecimals(1)
+        self.spin_budget.setValue(0)
+        budget_row.addWidget(self.spin_budget)
+        self.layout.addLayout(budget_row)
+
         self.btn_train = QPushButton("开始训练模型")
         self.btn_save = QPushButton("保存模型")
         self.layout.addWidget(self.btn_train)
@@ -53,7 +73,7 @@ class TrainTab(QWidget):
         ok = self.trainer.load_data(csvs)
         if ok:
             self.csv_paths = csvs
-            self.set_status(f"已加载 {len(csvs)} 个文件中的数据")
+            self.set_status(self.loaded_message(len(csvs)))
         else:
             self.set_status("加载失败，请检查文件格式")
 
@@ -67,20 +87,56 @@ class TrainTab(QWidget):
         ok = self.trainer.load_data(files)
         if ok:
             self.csv_paths = files
-            self.set_status(f"已加载 {len(files)} 个文件中的数据")
+            self.set_status(self.loaded_message(len(files)))
         else:
             self.set_status("加载失败，请检查文件格式")
 
+    def loaded_message(self, n_files):
+        return (f"已加载 {n_files} 个文件中的数据"
+                f"（{self.trainer.n_raw_rows} 组点对，去重后 {len(self.trainer.df)} 行）")
+
     def train_model(self):
         if not self.csv_paths:
             self.set_status("请先加载数据")
             return
 
         self.set_status("训练中，请稍候...")
-        self.trainer.train()
-        self.set_status("训练完成")
+        if self.chk_distributed.isChecked():
+            if not self.train_distributed():
+                return
+        else:
+            self.trainer.search_backend = None
+            self.trainer.train(latency_budget_us=self.latency_budget())
+        self.set_status(f"训练完成（模型：{self.trainer.model_name}）")
         self.text_report.setText(self.trainer.get_report())
 
+    def train_distributed(self):
+        try:
+            backend = DistributedBackend(
+                address=parse_address(SEARCH_ADDRESS),
+                authkey=SEARCH_AUTHKEY.encode() if SEARCH_AUTHKEY else None,
+                progress_callback=self.report_progress,
+            )
+        except (OSError, ValueError) as e:
+            self.set_status(f"分布式调参启动失败: {e}")
+            return False
+        backend.start_local_workers()
+        self.trainer.search_backend = backend
+        try:
+            self.trainer.train(latency_budget_us=self.latency_budget())
+        finally:
+            self.trainer.search_backend = None
+            backend.close()
+        return True
+
+    def latency_budget(self):
+        value = self.spin_budget.value()
+        return value if value > 0 else None
+
+    def report_progress(self, done, total):
+        self.set_status(f"调参中：{done}/{total}")
+        QApplication.processEvents()
+
     def save_model(self):
         if self.trainer.model is None:
             self.set_status("还未训练模型，无法保存")
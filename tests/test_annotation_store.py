@@ -0,0 +1,76 @@
+import numpy as np
+
+from logic.annotation_store import AnnotationStore, SAMPLE
+
+
+def add_pair(store, x, y, layer=1):
+    store.add_point(x, y, (10, 20, 30), (0.1, 0.2, 0.3))
+    store.add_point(x + 5, y, (40, 50, 60), (0.4, 0.5, 0.6), layer)
+
+
+def test_delete_dead_pair_keeps_pending_sample():
+    store = AnnotationStore()
+    add_pair(store, 0, 0)
+    add_pair(store, 100, 100)
+    assert store.remove_last_point() == 3
+    # 撤销衬底点后点对 1 已不存在，样本点 2 重新等待衬底
+    assert list(store.pairs()) == [0] and store.has_pending()
+    store.delete_pair(1)
+    assert len(store) == 3 and store.has_pending()
+    assert store.kind(int(store.points()[-1])) == SAMPLE
+
+
+def test_delete_point_and_lasso():
+    store = AnnotationStore()
+    for i in range(10):
+        add_pair(store, 20 * i, 0, layer=i)
+    store.delete_point(store.hit_test(41, 1))
+    assert store.pair_count() == 9 and 2 not in store.pairs()
+    selected = store.pairs_of(store.select_lasso([(-10, -10), (70, -10), (70, 10), (-10, 10)]))
+    assert list(selected) == [0, 1, 3]
+    store.set_layer_count(selected, 7)
+    features, layers = store.feature_matrix()
+    assert len(features) == 9 and np.array_equal(layers[:3], [7, 7, 7])
+
+
+def test_pair_features_sign_and_dtype():
+    from logic.annotation_store import pair_features
+    rgb1, rgb2 = np.array([[10, 200, 0]]), np.array([[20, 100, 0]])
+    hsv1, hsv2 = np.array([[0.1, 0.5, 0.2]]), np.array([[0.3, 0.25, 0.0]])
+    signed = pair_features(rgb1, hsv1, rgb2, hsv2)
+    unsigned = pair_features(rgb1, hsv1, rgb2, hsv2, signed=False, dtype=np.float32)
+    assert unsigned.dtype == np.float32 and signed.shape == (1, 24)
+    assert np.array_equal(signed[0, 18:21], [-10, 100, 0])
+    assert np.array_equal(unsigned[0, 18:21], [10, 100, 0])
+    # 分母为 0 时比值为 0
+    assert signed[0, 14] == 0 and signed[0, 17] == 0
+    assert np.allclose(signed[0, 12:18], unsigned[0, 12:18])
+
+
+def test_large_lasso_with_vertex_on_point():
+    """超过 1024 像素的套索会缩小栅格，顶点正好落在点上时不能越界或读到下一行"""
+    rng = np.random.default_rng(0)
+    store = AnnotationStore()
+    xy = rng.integers(0, 4000, size=(50, 2))
+    for x, y in xy:
+        store.add_point(float(x), float(y), (10, 20, 30), (0.1, 0.2, 0.3))
+    for k, (x1, y1) in enumerate(xy):
+        for x0, y0 in xy[:20]:
+            if x1 - x0 <= 1024 and y1 - y0 <= 1024:
+                continue
+            x0, y0 = min(x0, x1), min(y0, y1)
+            poly = [(x0, y0), (x1, y0), (x1, y1), (x0, y1)]
+            selected = store.select_lasso(poly)
+            # 顶点上的点一定被选中；包围盒外的点一定不被选中
+            assert k in selected
+            inside = (xy[:, 0] >= x0) & (xy[:, 0] <= x1) & (xy[:, 1] >= y0) & (xy[:, 1] <= y1)
+            assert set(selected) <= set(np.flatnonzero(inside))
+
+
+def test_grid_cell_matches_stored_coordinates():
+    store = AnnotationStore(cell_size=32)
+    # float64 时在第 0 格，保存为 float32 后是 32.0，落在第 1 格
+    store.add_point(31.9999999999, 0, (10, 20, 30), (0.1, 0.2, 0.3))
+    assert store.hit_test(32, 0) == 0
+    store.delete_point(0)
+    assert len(store) == 0 and store.hit_test(32, 0) == -1
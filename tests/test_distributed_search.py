@@ -0,0 +1,92 @@
+import threading
+
+import numpy as np
+import pytest
+from multiprocessing.connection import Client
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import GridSearchCV
+
+from logic.distributed_search import DistributedBackend, DistributedSearchCV, listener_authkey, run_worker
+
+AUTHKEY = b"test-key"
+
+
+def make_data(n=120, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n, 4))
+    y = (X[:, 0] + 0.5 * X[:, 1] > 0).astype(int)
+    return X, y
+
+
+def start_worker(backend):
+    t = threading.Thread(target=run_worker, args=(backend.address, AUTHKEY), daemon=True)
+    t.start()
+    return t
+
+
+def stuck_worker(address, received):
+    """领取任务后不再回复的工作进程"""
+    conn = Client(tuple(address), authkey=AUTHKEY)
+    while True:
+        try:
+            msg = conn.recv()
+        except (EOFError, OSError):
+            break
+        if msg[0] == "fit":
+            received.set()
+
+
+def test_matches_grid_search():
+    X, y = make_data()
+    grid = {"C": [0.1, 1.0, 10.0]}
+    backend = DistributedBackend(authkey=AUTHKEY)
+    try:
+        start_worker(backend)
+        search = DistributedSearchCV(LogisticRegression(), grid, backend, cv=3).fit(X, y)
+    finally:
+        backend.close()
+    expected = GridSearchCV(LogisticRegression(), grid, cv=3).fit(X, y)
+    assert search.best_params_ == expected.best_params_
+    assert np.allclose(search.cv_results_["mean_test_score"], expected.cv_results_["mean_test_score"])
+
+
+def test_stuck_worker_is_dropped_and_task_requeued():
+    X, y = make_data()
+    backend = DistributedBackend(authkey=AUTHKEY, task_timeout=0.5)
+    try:
+        received = threading.Event()
+        threading.Thread(target=stuck_worker, args=(backend.address, received), daemon=True).start()
+        payloads = [(LogisticRegression(), {}, np.arange(60), np.arange(60, 120), "accuracy")]
+        result = {}
+        runner = threading.Thread(target=lambda: result.update(scores=backend.run(X, y, payloads)))
+        runner.start()
+        assert received.wait(5)
+        start_worker(backend)
+        runner.join(10)
+        assert not runner.is_alive()
+        assert len(result["scores"]) == 1
+        assert backend.worker_count() == 1
+    finally:
+        backend.close()
+
+
+def test_authkey_required_off_loopback():
+    assert listener_authkey(("0.0.0.0", 0), b"explicit") == b"explicit"
+    with pytest.raises(ValueError):
+        listener_authkey(("0.0.0.0", 0))
+    with pytest.raises(ValueError):
+        DistributedBackend(address=("192.168.1.10", 0))
+    first, second = listener_authkey(("127.0.0.1", 0)), listener_authkey(("localhost", 0))
+    assert first != second and len(first) >= 32
+
+
+def test_local_workers_get_generated_key():
+    X, y = make_data()
+    backend = DistributedBackend()
+    try:
+        assert backend.authkey
+        threading.Thread(target=run_worker, args=(backend.address, backend.authkey), daemon=True).start()
+        payloads = [(LogisticRegression(), {}, np.arange(60), np.arange(60, 120), "accuracy")]
+        assert len(backend.run(X, y, payloads)) == 1
+    finally:
+        backend.close()
@@ -0,0 +1,70 @@
+import copy
+
+import numpy as np
+import pytest
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+from sklearn.svm import SVC
+
+from logic.fast_svm import BatchSVMEvaluator
+
+
+def make_data(n_classes, n=240, n_features=6, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n, n_features))
+    score = X[:, 0] + 0.5 * X[:, 1] ** 2 - 0.3 * X[:, 2] + rng.normal(scale=0.5, size=n)
+    y = np.digitize(score, np.quantile(score, np.linspace(0, 1, n_classes + 1)[1:-1]))
+    X_test = rng.normal(size=(500, n_features))
+    return X, y, X_test
+
+
+@pytest.fixture(scope="module", params=[
+    (n_classes, kernel) for n_classes in (2, 3, 5) for kernel in ("rbf", "linear", "poly", "sigmoid")
+], ids=lambda p: f"{p[0]}-{p[1]}")
+def fitted(request):
+    n_classes, kernel = request.param
+    X, y, X_test = make_data(n_classes)
+    svc = SVC(kernel=kernel, probability=True, random_state=0).fit(X, y)
+    return svc, X_test
+
+
+def clone_ovo(svc):
+    """一对一决策值与 libsvm 顺序相同；decision_function_shape 只影响决策值的输出形式"""
+    ovo = copy.deepcopy(svc)
+    ovo.decision_function_shape = "ovo"
+    return ovo
+
+
+def test_float64_matches_sklearn(fitted):
+    svc, X_test = fitted
+    evaluator = BatchSVMEvaluator.from_svc(svc, dtype=np.float64)
+    dec = clone_ovo(svc).decision_function(X_test)
+    if dec.ndim == 1:
+        # 二分类时 sklearn 公开的决策值与 libsvm 的符号相反
+        dec = -dec[:, None]
+    assert np.abs(evaluator.decision_function(X_test) - dec).max() < 1e-13
+    assert np.abs(evaluator.predict_proba(X_test) - svc.predict_proba(X_test)).max() < 1e-13
+
+
+def test_float32_close_to_sklearn(fitted):
+    svc, X_test = fitted
+    evaluator = BatchSVMEvaluator.from_svc(svc, dtype=np.float32, chunk_size=128)
+    expected = svc.predict_proba(X_test)
+    proba = evaluator.predict_proba(X_test)
+    assert np.abs(proba - expected).max() < 2e-4
+    assert np.array_equal(proba.argmax(axis=1), expected.argmax(axis=1))
+
+
+def test_numeric_gamma_and_pipeline():
+    X, y, X_test = make_data(3)
+    svc = Pipeline([("svc", SVC(gamma=0.3, probability=True, random_state=0))]).fit(X, y)
+    evaluator = BatchSVMEvaluator.from_svc(svc, dtype=np.float64)
+    assert np.abs(evaluator.predict_proba(X_test) - svc.predict_proba(X_test)).max() < 1e-13
+
+
+def test_rejects_unsupported_models():
+    X, y, _ = make_data(2)
+    with pytest.raises(ValueError):
+        BatchSVMEvaluator.from_svc(SVC().fit(X, y))
+    with pytest.raises(TypeError):
+        BatchSVMEvaluator.from_svc(StandardScaler().fit(X))
@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+import logic.flat_forest as flat_forest
+from logic.flat_forest import FlatForest
+
+
+def make_data(n=2000, n_features=12, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n, n_features))
+    score = 2 * X[:, 0] + X[:, 1] ** 2 - X[:, 2] * X[:, 3] + rng.normal(scale=0.7, size=n)
+    y = np.digitize(score, [-1.0, 0.5, 2.0])
+    return X, y
+
+
+@pytest.fixture(scope="module")
+def data():
+    X, y = make_data()
+    X_test = np.random.default_rng(1).normal(size=(3000, X.shape[1]))
+    return X, y, X_test
+
+
+@pytest.fixture(scope="module")
+def forest(data):
+    X, y, _ = data
+    return RandomForestClassifier(n_estimators=30, random_state=0).fit(X, y)
+
+
+@pytest.fixture(params=["small", "large"])
+def batch_path(request, monkeypatch):
+    """small 为所有 (样本, 树) 组合一起下降，large 为逐棵树按块遍历"""
+    monkeypatch.setattr(flat_forest, "SMALL_BATCH_PAIRS", 1 << 30 if request.param == "small" else 0)
+    return request.param
+
+
+@pytest.mark.parametrize("quantize", [False, True])
+def test_predict_proba_matches_sklearn_exactly(forest, data, batch_path, quantize):
+    _, _, X_test = data
+    flat = FlatForest.from_sklearn(forest, quantize=quantize)
+    for n in (1, 7, 500, len(X_test)):
+        assert np.array_equal(flat.predict_proba(X_test[:n]), forest.predict_proba(X_test[:n]))
+
+
+@pytest.mark.parametrize("quantize", [False, True])
+def test_save_load_roundtrip(forest, data, batch_path, quantize, tmp_path):
+    _, _, X_test = data
+    FlatForest.from_sklearn(forest, quantize=quantize).save(str(tmp_path))
+    for mmap in (True, False):
+        loaded = FlatForest.load(str(tmp_path), mmap=mmap)
+        assert loaded.quantized == quantize
+        assert np.array_equal(loaded.predict_proba(X_test), forest.predict_proba(X_test))
+
+
+def test_chunks_and_apply(forest, data, batch_path):
+    _, _, X_test = data
+    flat = FlatForest.from_sklearn(forest)
+    expected = forest.predict_proba(X_test)
+    assert np.array_equal(flat.predict_proba(X_test, chunk_size=256), expected)
+    leaves = flat.apply(X_test[:200])
+    assert leaves.shape == (200, forest.n_estimators)
+    # 同一叶子的概率与 sklearn 对应叶子的概率相同
+    for t, est in enumerate(forest.estimators_):
+        assert np.array_equal(flat.leaf_value[leaves[:, t]], est.predict_proba(X_test[:200]))
+
+
+def test_training_points_and_thresholds(forest, data, batch_path):
+    """训练数据与恰好落在阈值上的输入，检验 float32 向下取整与量化编码的边界"""
+    X, _, _ = data
+    thresholds = np.concatenate([est.tree_.threshold[est.tree_.children_left != -1]
+                                 for est in forest.estimators_])
+    rng = np.random.default_rng(2)
+    X_edge = X[:300].copy()
+    for f in range(X.shape[1]):
+        X_edge[:, f] = rng.choice(thresholds, size=len(X_edge))
+    for quantize in (False, True):
+        flat = FlatForest.from_sklearn(forest, quantize=quantize)
+        assert np.array_equal(flat.predict_proba(X), forest.predict_proba(X))
+        assert np.array_equal(flat.predict_proba(X_edge), forest.predict_proba(X_edge))
+
+
+@pytest.mark.parametrize("params", [
+    {"max_depth": 1},                 # 比补满的前几层还浅
+    {"min_samples_split": 10 ** 6},   # 只有根节点一个叶子
+    {"max_depth": 2, "n_estimators": 5},
+])
+def test_shallow_and_single_leaf_trees(data, batch_path, params):
+    X, y, X_test = data
+    forest = RandomForestClassifier(random_state=0, **{"n_estimators": 10, **params}).fit(X, y)
+    for quantize in (False, True):
+        flat = FlatForest.from_sklearn(forest, quantize=quantize)
+        assert np.array_equal(flat.predict_proba(X_test), forest.predict_proba(X_test))
+
+
+def test_rejects_other_models():
+    from sklearn.linear_model import LogisticRegression
+    X, y = make_data(200)
+    with pytest.raises(TypeError):
+        FlatForest.from_sklearn(LogisticRegression().fit(X, y))
@@ -0,0 +1,41 @@
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.svm import SVC
+
+from logic.model_selection import (ENSEMBLE, benchmark_latency, build_candidates, compare_models,
+                                   inference_proba, select_within_budget)
+
+
+def make_data(n=300, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n, 5))
+    y = np.digitize(X[:, 0] + 0.5 * X[:, 1], [-0.5, 0.5])
+    return X, y
+
+
+def test_inference_proba_uses_predictor_fast_path():
+    X, y = make_data()
+    candidates = build_candidates(SVC(probability=True, random_state=0),
+                                  RandomForestClassifier(n_estimators=20, random_state=0))
+    model = candidates[ENSEMBLE].fit(X, y)
+    predict_proba = inference_proba(model)
+    assert predict_proba.__self__.fast_members is not None
+    batch = np.random.default_rng(1).normal(size=(5000, 5))
+    for rows in (batch[:1], batch):
+        assert np.abs(predict_proba(rows) - model.predict_proba(rows)).max() < 1e-3
+
+
+def test_compare_and_select():
+    X, y = make_data()
+    candidates = build_candidates(SVC(probability=True, random_state=0),
+                                  RandomForestClassifier(n_estimators=20, random_state=0))
+    results = compare_models(candidates, X, y, cv=3, batch_size=2000, n_jobs=1)
+    assert [r["name"] for r in results] == list(candidates)
+    assert all(r["batch_us"] > 0 and r["single_ms"] > 0 for r in results)
+    chosen, ok = select_within_budget(results, None)
+    assert chosen["name"] == ENSEMBLE and ok
+    fastest = min(results, key=lambda r: r["batch_us"])
+    chosen, ok = select_within_budget(results, 0.0)
+    assert chosen is fastest and not ok
+    batch_us, single_ms = benchmark_latency(results[0]["model"], X, batch_size=500, repeats=1)
+    assert batch_us > 0 and single_ms > 0
@@ -0,0 +1,132 @@
+import os
+import pickle
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.feature_selection import RFE
+from sklearn.linear_model import LogisticRegression
+from sklearn.preprocessing import LabelEncoder, StandardScaler
+
+from logic.annotation_store import FEATURE_COLUMNS, pair_features
+from logic.prediction_service import PredictionClient, PredictionService
+from logic.predictor import GraphenePredictor
+from logic.utils import rgb_to_hsv
+
+
+def test_refuses_public_bind_without_authkey(tmp_path):
+    with pytest.raises(ValueError):
+        PredictionService(str(tmp_path), ("0.0.0.0", 0))
+    service = PredictionService(str(tmp_path), ("0.0.0.0", 0), authkey=b"explicit")
+    assert service.authkey == b"explicit" and not service.generated_authkey
+
+
+def test_client_connects_with_generated_key(tmp_path):
+    service = PredictionService(str(tmp_path), ("127.0.0.1", 0))
+    assert service.generated_authkey
+    service.start()
+    try:
+        with pytest.raises(ValueError):
+            PredictionClient(service.address)
+        client = PredictionClient(service.address, service.authkey)
+        assert client.stats()["requests"] == 0
+        client.close()
+    finally:
+        service.close()
+
+
+def save_tiny_model(folder):
+    """按 trainer.save_all 的目录格式保存一个小模型"""
+    rng = np.random.default_rng(0)
+    rgb1 = rng.integers(0, 256, size=(300, 3))
+    rgb2 = np.broadcast_to([120, 110, 100], rgb1.shape)
+    X = pd.DataFrame(pair_features(rgb1, rgb_to_hsv(rgb1), rgb2, rgb_to_hsv(rgb2), signed=False),
+                     columns=FEATURE_COLUMNS)
+    label_encoder = LabelEncoder().fit([1, 2, 3])
+    y = np.digitize(rgb1.sum(axis=1), [250, 500])
+    scaler = StandardScaler().fit(X)
+    X_scaled = scaler.transform(X)
+    rfe = RFE(LogisticRegression(max_iter=500), n_features_to_select=8).fit(X_scaled, y)
+    model = RandomForestClassifier(n_estimators=10, random_state=0).fit(rfe.transform(X_scaled), y)
+    os.makedirs(folder)
+    for name, obj in [("scaler", scaler), ("rfe", rfe), ("model", model),
+                      ("label_encoder", label_encoder), ("features", list(FEATURE_COLUMNS))]:
+        with open(os.path.join(folder, f"{name}.pkl"), "wb") as f:
+            pickle.dump(obj, f)
+
+
+@pytest.fixture
+def service(tmp_path):
+    save_tiny_model(str(tmp_path / "tiny"))
+    # 窗口足够长，保证并发请求落在同一个批次中
+    service = PredictionService(str(tmp_path), ("127.0.0.1", 0), authkey=b"test", batch_window=0.5)
+    service.start()
+    service.get_predictor("tiny")
+    yield service
+    service.close()
+
+
+def run_concurrently(service, calls):
+    """每个调用使用自己的客户端连接，同时发出请求，返回 (结果, 异常) 列表"""
+    clients = [PredictionClient(service.address, service.authkey) for _ in calls]
+    barrier = threading.Barrier(len(calls))
+    out = [None] * len(calls)
+
+    def worker(k):
+        barrier.wait()
+        try:
+            out[k] = (calls[k](clients[k]), None)
+        except Exception as e:
+            out[k] = (None, e)
+
+    threads = [threading.Thread(target=worker, args=(k,)) for k in range(len(calls))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    for c in clients:
+        c.close()
+    return out
+
+
+def test_concurrent_requests_share_one_batch(service, tmp_path):
+    rng = np.random.default_rng(1)
+    inputs = [(rng.integers(0, 256, size=(k + 1, 3)), rng.integers(0, 256, size=(k + 1, 3)))
+              for k in range(8)]
+    out = run_concurrently(service, [lambda c, a=a, b=b: c.predict("tiny", a, b) for a, b in inputs])
+
+    reference = GraphenePredictor()
+    assert reference.load_model(str(tmp_path / "tiny"))
+    for (result, error), (a, b) in zip(out, inputs):
+        assert error is None
+        labels, proba = result
+        expected_labels, expected_proba = reference.predict_rgb(a, b)
+        assert np.array_equal(labels, expected_labels)
+        assert np.array_equal(proba, expected_proba)
+    stats = PredictionClient(service.address, service.authkey).stats()
+    assert stats["batches"] == 1 and stats["requests"] == 8
+    assert stats["rows"] == sum(len(a) for a, _ in inputs)
+
+
+def test_predict_region_shapes(service):
+    client = PredictionClient(service.address, service.authkey)
+    region = np.random.default_rng(2).integers(0, 256, size=(5, 7, 3))
+    labels, proba = client.predict_region("tiny", region, (120, 110, 100))
+    assert labels.shape == (5, 7) and proba.shape == (5, 7, 3)
+    assert np.allclose(proba.sum(axis=2), 1)
+    assert set(np.unique(labels)) <= {1, 2, 3}
+    client.close()
+
+
+def test_unknown_model_fails_only_its_request(service):
+    rgb = np.array([[10, 20, 30]])
+    calls = [lambda c: c.predict("missing", rgb, rgb)] + [lambda c: c.predict("tiny", rgb, rgb)] * 3
+    out = run_concurrently(service, calls)
+    assert isinstance(out[0][1], RuntimeError) and "missing" in str(out[0][1])
+    assert all(error is None and len(result[0]) == 1 for result, error in out[1:])
+    # 出错后连接与服务仍可用
+    client = PredictionClient(service.address, service.authkey)
+    assert client.stats()["requests"] == 4
+    client.close()